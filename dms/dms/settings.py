@@ -81,13 +81,79 @@ WSGI_APPLICATION = 'dms.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE selects the backend: 'sqlite' (default) or 'postgresql'. Connections
+# persist for DB_CONN_MAX_AGE seconds; with DB_POOL, PostgreSQL uses a psycopg
+# connection pool instead (requires psycopg[pool]).
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Take the write lock when a transaction starts, so concurrent
+                # writers wait on busy_timeout instead of failing mid-transaction
+                'transaction_mode': config('SQLITE_TRANSACTION_MODE', default='IMMEDIATE'),
+            },
+        }
+    }
+elif DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='dms'),
+            'USER': config('DB_USER', default='dms'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # Django's pool replaces persistent connections; the two can't be combined
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+                    'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+                    'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+                },
+            } if DB_POOL else {},
+        }
+    }
+else:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f"Unsupported DB_ENGINE {DB_ENGINE!r}; use 'sqlite' or 'postgresql'")
+
+# PRAGMAs applied to every new SQLite connection (flood_app.signals)
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='WAL'),
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL'),
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT', default=5000, cast=int),  # Milliseconds
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),  # Bytes
+    'cache_size': config('SQLITE_CACHE_SIZE', default=-64 * 1024, cast=int),  # Negative: KiB
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='dms'),
     }
 }
 
+# Live weather on the user dashboard: served fresh for LIVE_WEATHER_TTL seconds,
+# then served stale for up to LIVE_WEATHER_STALE_TTL more while it is refreshed.
+LIVE_WEATHER_TTL = config('LIVE_WEATHER_TTL', default=600, cast=int)
+LIVE_WEATHER_STALE_TTL = config('LIVE_WEATHER_STALE_TTL', default=3600, cast=int)
+LIVE_WEATHER_TIMEOUT = config('LIVE_WEATHER_TIMEOUT', default=5, cast=int)
+# Seconds a failed fetch is remembered, so callers don't each wait out the timeout
+LIVE_WEATHER_FAILURE_TTL = config('LIVE_WEATHER_FAILURE_TTL', default=60, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -126,6 +192,54 @@ USE_TZ = True
 STATIC_URL = 'static/'
 LOGIN_URL = '/admin/login/'
 
+# Trained flood model artifacts
+FLOOD_MODEL_DIR = config('FLOOD_MODEL_DIR', default=str(BASE_DIR / 'models'))
+FLOOD_MODEL_KEEP_VERSIONS = config('FLOOD_MODEL_KEEP_VERSIONS', default=5, cast=int)
+FLOOD_FEATURE_CACHE_DIR = config('FLOOD_FEATURE_CACHE_DIR', default=str(BASE_DIR / 'cache' / 'features'))
+# 'global' fits one model; 'location' or 'basin' fit one per group, falling back
+# to the global model for groups with fewer than FLOOD_MIN_GROUP_SAMPLES rows.
+FLOOD_MODEL_GROUPING = config('FLOOD_MODEL_GROUPING', default='global')
+FLOOD_MIN_GROUP_SAMPLES = config('FLOOD_MIN_GROUP_SAMPLES', default=2000, cast=int)
+FLOOD_TRAINING_WORKERS = config('FLOOD_TRAINING_WORKERS', default=0, cast=int)  # 0 = one per CPU
+# Incremental mode fits SGD models that learn from each newly labelled batch
+# (predict.update_model) and are refitted from scratch every FLOOD_FULL_RETRAIN_DAYS.
+FLOOD_INCREMENTAL = config('FLOOD_INCREMENTAL', default=False, cast=bool)
+FLOOD_FULL_RETRAIN_DAYS = config('FLOOD_FULL_RETRAIN_DAYS', default=7, cast=int)
+
+# Shared outbound HTTP client (weather APIs and SMS)
+OUTBOUND_TIMEOUT = config('OUTBOUND_TIMEOUT', default=10.0, cast=float)
+OUTBOUND_RETRIES = config('OUTBOUND_RETRIES', default=3, cast=int)
+OUTBOUND_BACKOFF = config('OUTBOUND_BACKOFF', default=0.5, cast=float)
+OUTBOUND_POOL_HOSTS = config('OUTBOUND_POOL_HOSTS', default=10, cast=int)
+OUTBOUND_POOL_MAXSIZE = config('OUTBOUND_POOL_MAXSIZE', default=16, cast=int)
+
+# Flood alert SMS dispatch
+ALERT_PROBABILITY_THRESHOLD = config('ALERT_PROBABILITY_THRESHOLD', default=0.7, cast=float)
+ALERT_SMS_PROVIDER = config('ALERT_SMS_PROVIDER', default='flood_app.send_alerts.TwilioProvider')
+ALERT_SMS_RATE = config('ALERT_SMS_RATE', default=1.0, cast=float)  # Messages per second
+ALERT_SMS_BURST = config('ALERT_SMS_BURST', default=1, cast=int)
+ALERT_SMS_WORKERS = config('ALERT_SMS_WORKERS', default=8, cast=int)
+
+# Background pipeline jobs started from /predict/
+PIPELINE_JOB_STALE_MINUTES = config('PIPELINE_JOB_STALE_MINUTES', default=60, cast=int)
+
+# Retention of raw readings and their rollups (0 keeps everything)
+RETENTION_RAW_DAYS = config('RETENTION_RAW_DAYS', default=365, cast=int)
+# Citizen rainfall reports are kept unless this opts in to pruning them
+RETENTION_REPORT_DAYS = config('RETENTION_REPORT_DAYS', default=0, cast=int)
+RETENTION_ROLLUP_DAYS = config('RETENTION_ROLLUP_DAYS', default=3650, cast=int)
+RETENTION_DELETE_CHUNK = config('RETENTION_DELETE_CHUNK', default=2000, cast=int)
+RETENTION_DELETE_PAUSE = config('RETENTION_DELETE_PAUSE', default=0.1, cast=float)  # Seconds between chunks
+RETENTION_VACUUM_DAYS = config('RETENTION_VACUUM_DAYS', default=7, cast=int)
+
+# Periodic jobs (flood_app.cron), run by the run_cron_jobs command once their
+# interval has passed. Schedule that command from the system crontab:
+#   */5 * * * * cd /path/to/dms && python manage.py run_cron_jobs
+CRON_CLASSES = [
+    'flood_app.cron.PredictFloodCronJob',
+    'flood_app.cron.PruneHistoryCronJob',
+]
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -0,0 +1,109 @@
+import threading
+from collections import defaultdict
+
+from .models import Location
+
+
+class BasinGraph:
+    """The river network of the monitored stations as a DAG.
+
+    Each station drains into at most one downstream station, with the river
+    travel time in hours on that edge (Location.downstream/travel_hours).
+    ``order`` lists every station after all of the stations upstream of it.
+    """
+
+    def __init__(self, rows):
+        # rows: (id, name, basin, downstream_id, travel_hours)
+        names = {row[0]: row[1] for row in rows}
+        self.basin = {name: basin for _, name, basin, _, _ in rows}
+        self.downstream = {}
+        self.upstream = defaultdict(list)
+        for _, name, _, downstream_id, hours in rows:
+            if downstream_id in names:
+                self.downstream[name] = (names[downstream_id], hours)
+                self.upstream[names[downstream_id]].append((name, hours))
+
+        # Kahn's algorithm, so a cycle entered by mistake is reported rather
+        # than silently dropping stations from the order
+        pending = {name: len(self.upstream[name]) for name in self.basin}
+        ready = sorted(name for name, count in pending.items() if count == 0)
+        self.order = []
+        while ready:
+            name = ready.pop()
+            self.order.append(name)
+            if name in self.downstream:
+                below = self.downstream[name][0]
+                pending[below] -= 1
+                if pending[below] == 0:
+                    ready.append(below)
+        if len(self.order) != len(self.basin):
+            raise ValueError(f"River graph has a cycle through: {sorted(set(self.basin) - set(self.order))}")
+
+    def downstream_path(self, name):
+        """Stations below ``name`` as ``[(station, hours from name)]``, nearest first."""
+        path, hours = [], 0
+        while name in self.downstream:
+            name, lag = self.downstream[name]
+            hours += lag
+            path.append((name, hours))
+        return path
+
+    def basins(self):
+        """``{basin: [station, ...]}`` with each basin's stations in topological order."""
+        grouped = defaultdict(list)
+        for name in self.order:
+            grouped[self.basin[name]].append(name)
+        return dict(grouped)
+
+
+_graph = None
+_lock = threading.Lock()
+
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        with _lock:
+            if _graph is None:
+                _graph = BasinGraph(list(
+                    Location.objects.values_list('id', 'name', 'basin', 'downstream_id', 'travel_hours')
+                ))
+    return _graph
+
+
+def invalidate():
+    global _graph
+    _graph = None
+
+
+def basin_risk(station_risk, at_risk, graph=None):
+    """Fold per-station forecasts into one summary per basin, worst first.
+
+    ``station_risk`` maps station names to ``(peak probability, worst
+    severity)``; ``at_risk`` is the set of severities treated as flooding.
+    Stations below an at-risk station are listed with the hours until its
+    water reaches them.
+    """
+    graph = graph or get_graph()
+    summaries = []
+    for basin, names in graph.basins().items():
+        forecast = [(name, *station_risk[name]) for name in names if name in station_risk]
+        if not forecast:
+            continue
+        flooding = [name for name, _, severity in forecast if severity in at_risk]
+        arrivals = {}
+        for name in flooding:
+            for below, hours in graph.downstream_path(name):
+                if below not in flooding:
+                    arrivals[below] = min(hours, arrivals.get(below, hours))
+        peak = max(forecast, key=lambda row: row[1])
+        summaries.append({
+            'basin': basin,
+            'probability': peak[1],
+            'severity': min(severity for _, _, severity in forecast),
+            'peak_station': peak[0],
+            'stations': len(forecast),
+            'at_risk': flooding,
+            'downstream': sorted(arrivals.items(), key=lambda item: item[1]),
+        })
+    return sorted(summaries, key=lambda summary: (summary['severity'], -summary['probability']))
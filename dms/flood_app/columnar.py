@@ -0,0 +1,110 @@
+import shutil
+from pathlib import Path
+from urllib.parse import unquote
+
+import pandas as pd
+from django.core.management.base import CommandError
+
+from .models import FloodPrediction, RainfallData, WeatherData
+
+EXPORT_CHUNK_SIZE = 50_000
+
+# Exported tables: model, exported columns and the timestamp used for the
+# month partition.
+TABLES = {
+    'weather': (WeatherData, ['location', 'recorded_at', 'temperature', 'rainfall'], 'recorded_at'),
+    'rainfall': (RainfallData, ['user_id', 'location', 'rainfall_amount', 'collected_time', 'source'], 'collected_time'),
+    'predictions': (FloodPrediction, ['location', 'predicted_date', 'probability', 'severity_level'], 'predicted_date'),
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.parquet
+    except ImportError:
+        raise CommandError("Parquet support requires pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def table_root(root, table):
+    return Path(root) / table
+
+
+def export_table(table, root):
+    """Export ``table`` to ``root/<table>/location=.../month=YYYY-MM/`` Parquet files.
+
+    Rows are streamed from the database in chunks, so memory stays bounded.
+    Any previous export of the table under ``root`` is replaced. Returns the
+    number of rows written.
+    """
+    pa = _pyarrow()
+    model, columns, time_column = TABLES[table]
+    target = table_root(root, table)
+    if target.exists():
+        shutil.rmtree(target)
+
+    rows = model.objects.order_by().values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    written = 0
+    chunk_index = 0
+    while True:
+        chunk = [row for _, row in zip(range(EXPORT_CHUNK_SIZE), rows)]
+        if not chunk:
+            break
+        frame = pd.DataFrame.from_records(chunk, columns=columns)
+        frame[time_column] = pd.to_datetime(frame[time_column], utc=True)
+        frame['month'] = frame[time_column].dt.strftime('%Y-%m')
+        pa.parquet.write_to_dataset(
+            pa.Table.from_pandas(frame, preserve_index=False),
+            root_path=str(target),
+            partition_cols=['location', 'month'],
+            basename_template=f'part-{chunk_index}-{{i}}.parquet',
+        )
+        written += len(frame)
+        chunk_index += 1
+    return written
+
+
+def read_table(path, location=None, since=None, columns=None):
+    """Read an exported Parquet dataset (or a single file) into a DataFrame.
+
+    ``location`` and ``since`` are pushed down to the scan, so only the
+    matching partitions are opened; files are memory-mapped.
+    """
+    pa = _pyarrow()
+    path = Path(path)
+    if not path.exists():
+        raise CommandError(f"{path} does not exist")
+    dataset = pa.dataset.dataset(
+        str(path), format='parquet', partitioning='hive',
+        filesystem=pa.fs.LocalFileSystem(use_mmap=True),
+    )
+    names = set(dataset.schema.names)
+    time_column = next((TABLES[t][2] for t in TABLES if TABLES[t][2] in names), None)
+
+    condition = None
+    if location is not None:
+        condition = pa.dataset.field('location') == location
+    if since is not None and time_column:
+        after = pa.dataset.field(time_column) >= pa.scalar(pd.Timestamp(since), type=dataset.schema.field(time_column).type)
+        condition = after if condition is None else condition & after
+    frame = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    return frame.drop(columns=['month'], errors='ignore')
+
+
+def read_dump(path):
+    """Read a Parquet dataset/file or a CSV dump into a DataFrame."""
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        return pd.read_csv(path)
+    return read_table(path)
+
+
+def partition_locations(root, table='weather'):
+    """Locations present in an exported dataset, read from the partition layout."""
+    return sorted(
+        unquote(path.name.split('=', 1)[1])
+        for path in table_root(root, table).glob('location=*') if path.is_dir()
+    )
@@ -0,0 +1,15 @@
+"""Severity levels shared by the model, the views and the alerts.
+
+Kept free of heavy imports, so modules such as flood_app.views can use them
+without loading pandas or scikit-learn.
+"""
+
+SEVERITY_LEVELS = [1, 2, 3, 4]  # Critical, High, Moderate, Low
+SEVERITY_MAP = {
+    1: "Critical",
+    2: "High",
+    3: "Moderate",
+    4: "Low"
+}
+# Severity levels counted towards the flood probability (Critical and High).
+FLOOD_LEVELS = (1, 2)
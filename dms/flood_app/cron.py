@@ -1,6 +1,7 @@
+"""Periodic jobs listed in settings.CRON_CLASSES and run by the run_cron_jobs command."""
 from django_cron import CronJobBase, Schedule
-from flood_app.predict import train_predict_model
-from flood_app.send_alerts import send_flood_alert
+from flood_app.send_alerts import send_flood_alerts
+from flood_app.retention import run_retention
 from flood_app.management.commands.collect_weather_data import Command as CollectWeatherData
 
 class PredictFloodCronJob(CronJobBase):
@@ -11,9 +12,20 @@ class PredictFloodCronJob(CronJobBase):
     def do(self):
         try:
             collect_command = CollectWeatherData()
-            collect_command.handle(use_weatherapi=True)
-            train_predict_model()
-            send_flood_alert()
+            collect_command.handle(use_weatherapi=True)  # Also retrains and forecasts
+            send_flood_alerts()
             print("Predictions and alerts processed.")
         except Exception as e:
-            print(f"Error in cron job: {str(e)}")
\ No newline at end of file
+            print(f"Error in cron job: {str(e)}")
+
+class PruneHistoryCronJob(CronJobBase):
+    RUN_EVERY_MINS = 1440  # Daily; VACUUM runs every RETENTION_VACUUM_DAYS
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'flood_app.prune_history'
+
+    def do(self):
+        try:
+            report = run_retention()
+            print(f"Retention: deleted {report['deleted']}, reclaimed {report['reclaimed']} bytes.")
+        except Exception as e:
+            print(f"Error in cron job: {str(e)}")
@@ -0,0 +1,270 @@
+import datetime
+import hashlib
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from scipy.signal import lfilter
+
+from .basins import get_graph
+from .columnar import partition_locations, read_table, table_root
+from .models import RainfallData, WeatherData
+
+# Trailing rainfall windows, in hours.
+RAIN_WINDOWS = (1, 6, 24, 72)
+# Windows of rain_*h summed over every station upstream, lagged by river travel time.
+UPSTREAM_WINDOWS = (24, 72)
+FEATURE_COLUMNS = [f'rain_{hours}h' for hours in RAIN_WINDOWS] + [
+    'temperature', 'antecedent_precip', 'reported_rain_24h',
+] + [f'upstream_rain_{hours}h' for hours in UPSTREAM_WINDOWS]
+# Daily recession constant of the antecedent precipitation index.
+API_DAILY_DECAY = 0.85
+# Hours of history needed to recompute every feature for a new hour.
+CONTEXT_HOURS = max(RAIN_WINDOWS)
+# 24h rainfall bands (mm) used to label the severity of a forecast day.
+SEVERITY_BANDS = [(100.0, 1), (50.0, 2), (20.0, 3)]
+LOW_SEVERITY = 4
+CHUNK_SIZE = 5000
+
+
+def monitored_locations(parquet_root=None):
+    if parquet_root:
+        return partition_locations(parquet_root)
+    return list(WeatherData.objects.order_by().values_list('location', flat=True).distinct())
+
+
+def cache_path(location, parquet_root=None):
+    """Cache file for ``location``; each Parquet export gets its own directory.
+
+    An export is a snapshot that can differ from the database, so frames
+    built from one must never be extended from the other.
+    """
+    directory = Path(settings.FLOOD_FEATURE_CACHE_DIR)
+    if parquet_root:
+        key = hashlib.sha1(str(Path(parquet_root).resolve()).encode()).hexdigest()[:12]
+        directory = directory / f'parquet-{key}'
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r'[^a-z0-9]+', '-', location.lower()).strip('-')
+    return directory / f'{slug}.pkl'
+
+
+def stale_path(location):
+    return cache_path(location).with_suffix('.stale')
+
+
+def mark_stale(location, since):
+    """Record that ``location``'s readings from ``since`` on changed after being cached.
+
+    Backfills and corrections can land before the last cached hour, which an
+    append-only refresh would never read again; the next refresh_location
+    recomputes the cached features from the earliest marked hour instead.
+    """
+    if not cache_path(location).exists():
+        return
+    path = stale_path(location)
+    current = _read_stale(path)
+    if current is None or since < current:
+        path.write_text(since.isoformat())
+
+
+def _read_stale(path):
+    try:
+        return datetime.datetime.fromisoformat(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _read_records(location, since=None, parquet_root=None):
+    """Return one location's (weather, reports) records from the DB or Parquet.
+
+    With ``parquet_root`` the history is read from an export_parquet dataset,
+    scanning only that location's partitions, instead of querying the database.
+    """
+    reports_since = since - datetime.timedelta(hours=24) if since is not None else None
+    if parquet_root:
+        observed = read_table(table_root(parquet_root, 'weather'), location, since,
+                              columns=['recorded_at', 'rainfall', 'temperature'])
+        observed.columns = ['time', 'rain', 'temperature']
+        reported = pd.DataFrame(columns=['time', 'amount'])
+        if table_root(parquet_root, 'rainfall').exists():
+            reported = read_table(table_root(parquet_root, 'rainfall'), location, reports_since,
+                                  columns=['collected_time', 'rainfall_amount'])
+            reported.columns = ['time', 'amount']
+        return observed, reported
+
+    weather = WeatherData.objects.filter(location=location).order_by('recorded_at')
+    reports = RainfallData.objects.filter(location=location).order_by('collected_time')
+    if since is not None:
+        weather = weather.filter(recorded_at__gte=since)
+        reports = reports.filter(collected_time__gte=reports_since)
+    observed = pd.DataFrame.from_records(
+        weather.values_list('recorded_at', 'rainfall', 'temperature').iterator(chunk_size=CHUNK_SIZE),
+        columns=['time', 'rain', 'temperature'],
+    )
+    reported = pd.DataFrame.from_records(
+        reports.values_list('collected_time', 'rainfall_amount').iterator(chunk_size=CHUNK_SIZE),
+        columns=['time', 'amount'],
+    )
+    return observed, reported
+
+
+def _read_hourly(location, since=None, parquet_root=None):
+    """Load one location's weather and reported rainfall into an hourly frame."""
+    observed, reported = _read_records(location, since, parquet_root)
+    if observed.empty:
+        return None
+    observed = observed.set_index(pd.DatetimeIndex(pd.to_datetime(observed['time'], utc=True))).sort_index()
+    hourly = pd.DataFrame({
+        'rain': observed['rain'].resample('h').sum(),
+        'temperature': observed['temperature'].resample('h').mean(),
+    })
+
+    if reported.empty:
+        hourly['reported'] = np.nan
+    else:
+        reported = reported.set_index(pd.DatetimeIndex(pd.to_datetime(reported['time'], utc=True)))
+        hourly['reported'] = reported['amount'].resample('h').mean().reindex(hourly.index)
+    return hourly
+
+
+def compute_features(raw, previous_api=0.0):
+    """Compute the feature columns for a gap-free hourly ``raw`` frame.
+
+    ``previous_api`` seeds the antecedent precipitation index with its value
+    for the hour before ``raw`` starts, so a tail can be computed on its own.
+    """
+    rain = raw['rain'].to_numpy(dtype=float)
+    frame = raw.copy()
+    cumulative = np.concatenate(([0.0], np.cumsum(rain)))
+    for hours in RAIN_WINDOWS:
+        start = np.maximum(np.arange(1, len(rain) + 1) - hours, 0)
+        frame[f'rain_{hours}h'] = cumulative[1:] - cumulative[start]
+    frame['temperature'] = raw['temperature'].ffill().fillna(0.0)
+    decay = API_DAILY_DECAY ** (1 / 24)
+    frame['antecedent_precip'] = lfilter([1.0], [1.0, -decay], rain, zi=[decay * previous_api])[0]
+    frame['reported_rain_24h'] = (
+        raw['reported'].rolling(24, min_periods=1).mean().fillna(0.0).to_numpy()
+    )
+    return frame
+
+
+def refresh_location(location, rebuild=False, parquet_root=None):
+    """Return the cached feature frame for ``location``, appending new hours.
+
+    Only readings at or after the last cached hour, or the earliest hour
+    marked by mark_stale, are queried; the features for those hours are
+    recomputed with CONTEXT_HOURS of cached history and appended to the
+    cache. ``rebuild`` discards the cache first. Stale markers only apply to
+    the database cache; an export is never modified in place.
+    """
+    path = cache_path(location, parquet_root)
+    cached = None if rebuild or not path.exists() else pd.read_pickle(path)
+    stale = None if parquet_root else _read_stale(stale_path(location))
+    if cached is not None and stale is not None:
+        # Drop the hours a backfill or correction touched, so they're read again
+        cached = cached[cached.index < pd.Timestamp(stale).floor('h')]
+        if cached.empty:
+            cached = None
+    since = cached.index[-1].to_pydatetime() if cached is not None else None
+
+    fresh = _read_hourly(location, since, parquet_root)
+    if fresh is None:
+        return cached
+    if cached is None:
+        frame = compute_features(fresh)
+    else:
+        kept = cached[cached.index < fresh.index[0]]
+        context = kept[['rain', 'temperature', 'reported']].iloc[-CONTEXT_HOURS:]
+        seed = len(kept) - len(context) - 1
+        previous_api = kept['antecedent_precip'].iloc[seed] if seed >= 0 else 0.0
+        raw = pd.concat([context, fresh])
+        raw = raw.reindex(pd.date_range(raw.index[0], raw.index[-1], freq='h'))
+        raw['rain'] = raw['rain'].fillna(0.0)
+        tail = compute_features(raw, previous_api=previous_api)
+        frame = pd.concat([kept, tail.iloc[len(context):]])
+    frame.to_pickle(path)
+    if stale is not None and _read_stale(stale_path(location)) == stale:
+        stale_path(location).unlink(missing_ok=True)  # Unless a newer change was marked meanwhile
+    return frame
+
+
+def add_upstream_features(frames, graph=None):
+    """Add the upstream_rain_*h columns to every frame in ``frames``, in place.
+
+    A station's upstream rainfall is, for each directly upstream station, that
+    station's own and upstream rainfall shifted by the travel time between
+    them. Walking the basin graph in topological order means each upstream
+    total is complete before it is propagated further down.
+    """
+    graph = graph or get_graph()
+    for frame in frames.values():
+        for hours in UPSTREAM_WINDOWS:
+            frame[f'upstream_rain_{hours}h'] = 0.0
+    for location in graph.order:
+        frame = frames.get(location)
+        if frame is None:
+            continue
+        for upstream, lag in graph.upstream.get(location, ()):
+            source = frames.get(upstream)
+            if source is None:
+                continue
+            for hours in UPSTREAM_WINDOWS:
+                inflow = source[f'rain_{hours}h'] + source[f'upstream_rain_{hours}h']
+                frame[f'upstream_rain_{hours}h'] += (
+                    inflow.shift(freq=pd.Timedelta(hours=lag)).reindex(frame.index, fill_value=0.0).to_numpy()
+                )
+    return frames
+
+
+def refresh_features(locations=None, rebuild=False, parquet_root=None):
+    """Refresh the feature cache for every location; returns {location: frame}.
+
+    Upstream features are derived from the returned frames, so a station whose
+    upstream stations are left out of ``locations`` sees no upstream rain.
+    """
+    frames = {}
+    for location in locations or monitored_locations(parquet_root):
+        frame = refresh_location(location, rebuild=rebuild, parquet_root=parquet_root)
+        if frame is not None and len(frame):
+            frames[location] = frame
+    return add_upstream_features(frames)
+
+
+def severity_from_rainfall(rain_24h):
+    """Map 24h rainfall totals (mm) to severity levels 1 (Critical) to 4 (Low)."""
+    severity = np.full(len(rain_24h), LOW_SEVERITY)
+    for threshold, level in reversed(SEVERITY_BANDS):
+        severity[rain_24h >= threshold] = level
+    return severity
+
+
+def training_set(frames, horizons=range(1, 8), labelled_after=None):
+    """Stack (features, horizon) rows labelled with the observed severity.
+
+    The label for horizon ``h`` is the severity of the rainfall observed in the
+    24 hours ending ``h`` days after the feature timestamp, so hours whose
+    outcome is not known yet are dropped. ``labelled_after`` maps locations to
+    a timestamp and keeps only rows whose outcome became known after it.
+    """
+    X_parts, y_parts = [], []
+    for location, frame in frames.items():
+        features = frame[FEATURE_COLUMNS].to_numpy(dtype=float)
+        rain = frame['rain'].to_numpy(dtype=float)
+        cumulative = np.concatenate(([0.0], np.cumsum(rain)))
+        since = (labelled_after or {}).get(location)
+        for horizon in horizons:
+            end = np.arange(len(rain)) + 24 * horizon
+            known = end < len(rain)
+            if since is not None:
+                known[known] = frame.index[end[known]] > pd.Timestamp(since)
+            if not known.any():
+                continue
+            index = np.flatnonzero(known)
+            future_24h = cumulative[end[known] + 1] - cumulative[end[known] - 23]
+            X_parts.append(np.column_stack([features[index], np.full(len(index), horizon)]))
+            y_parts.append(severity_from_rainfall(future_24h))
+    if not X_parts:
+        return np.empty((0, len(FEATURE_COLUMNS) + 1)), np.empty(0, dtype=int)
+    return np.vstack(X_parts), np.concatenate(y_parts)
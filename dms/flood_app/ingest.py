@@ -0,0 +1,93 @@
+import datetime
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from .features import mark_stale
+from .locations import station_id
+from .models import WeatherData
+
+BATCH_SIZE = 500
+
+
+@dataclass(frozen=True)
+class WeatherColumns:
+    """Weather observations for one location, stored column by column."""
+    recorded_at: list
+    temperature: list
+    rainfall: list
+
+    def __len__(self):
+        return len(self.recorded_at)
+
+
+def frame_to_columns(frame):
+    """Convert a Meteostat hourly frame to WeatherColumns without iterating rows.
+
+    Missing temperature or precipitation readings are stored as 0, and the
+    naive Meteostat index is interpreted as UTC.
+    """
+    values = frame[['temp', 'prcp']].fillna(0.0)
+    index = values.index
+    if index.tz is None:
+        index = index.tz_localize(datetime.timezone.utc)
+    return WeatherColumns(
+        recorded_at=list(index.to_pydatetime()),
+        temperature=values['temp'].to_numpy(dtype=float).tolist(),
+        rainfall=values['prcp'].to_numpy(dtype=float).tolist(),
+    )
+
+
+def as_utc(value):
+    """Return ``value`` as an aware datetime, treating naive values as UTC."""
+    if timezone.is_naive(value):
+        return timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def upsert_weather_columns(location, columns, batch_size=BATCH_SIZE):
+    """Insert or update WeatherData for one location in bulk.
+
+    Existing keys are read with a single query, then new rows are written with
+    ``bulk_create`` and changed rows with ``bulk_update``, all in one
+    transaction. Cached features from the earliest changed hour on are marked
+    stale. Returns a ``(created, updated)`` tuple.
+    """
+    if not len(columns):
+        return 0, 0
+    recorded_at = columns.recorded_at
+    if timezone.is_naive(recorded_at[0]):
+        recorded_at = [as_utc(value) for value in recorded_at]
+    incoming = dict(zip(recorded_at, zip(columns.temperature, columns.rainfall)))
+    station = station_id(location)
+
+    with transaction.atomic():
+        existing = WeatherData.objects.filter(
+            location=location,
+            recorded_at__range=(min(incoming), max(incoming)),
+        ).order_by().values_list('pk', 'recorded_at', 'temperature', 'rainfall')
+
+        to_update = []
+        for pk, recorded_at, temperature, rainfall in existing:
+            values = incoming.pop(recorded_at, None)
+            if values is None or values == (temperature, rainfall):
+                continue
+            to_update.append(WeatherData(
+                pk=pk, location=location, station_id=station, recorded_at=recorded_at,
+                temperature=values[0], rainfall=values[1],
+            ))
+
+        to_create = [
+            WeatherData(location=location, station_id=station, recorded_at=recorded_at,
+                        temperature=temperature, rainfall=rainfall)
+            for recorded_at, (temperature, rainfall) in incoming.items()
+        ]
+        WeatherData.objects.bulk_create(to_create, batch_size=batch_size)
+        WeatherData.objects.bulk_update(
+            to_update, ['station', 'temperature', 'rainfall'], batch_size=batch_size
+        )
+
+    if to_create or to_update:
+        mark_stale(location, min(row.recorded_at for row in to_create + to_update))
+    return len(to_create), len(to_update)
@@ -0,0 +1,122 @@
+import datetime
+import logging
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import PipelineJob
+
+logger = logging.getLogger(__name__)
+
+# Seconds between a running job's heartbeats; well inside PIPELINE_JOB_STALE_MINUTES.
+HEARTBEAT_SECONDS = 30
+
+
+# The steps import their modules lazily: enqueueing a job from a view
+# shouldn't load pandas and scikit-learn into the web process up front.
+def _predict_step():
+    from .predict import run_predictions
+
+    result = run_predictions()
+    if not result:
+        raise RuntimeError("No data for prediction")
+    return {'version': result['version'], 'predictions': result['predictions'], 'timings': result['timings']}
+
+
+def _alerts_step():
+    from .send_alerts import send_flood_alerts
+
+    return send_flood_alerts()
+
+
+# Ordered (result key, progress label, callable) steps for each job kind.
+JOB_STEPS = {
+    'predict': [
+        ('predictions', 'Forecasting flood risk', _predict_step),
+        ('alerts', 'Sending alerts', _alerts_step),
+    ],
+}
+
+
+def _expire_stale_jobs(kind):
+    """Fail active jobs whose worker has been gone longer than PIPELINE_JOB_STALE_MINUTES.
+
+    A worker touches its job's heartbeat_at every HEARTBEAT_SECONDS, so a
+    long but healthy job is never expired; only a missing heartbeat is.
+    """
+    cutoff = timezone.now() - datetime.timedelta(minutes=settings.PIPELINE_JOB_STALE_MINUTES)
+    PipelineJob.objects.filter(
+        kind=kind, status__in=PipelineJob.ACTIVE_STATUSES, heartbeat_at__lt=cutoff,
+    ).update(status='failed', error='Job expired before finishing.', finished_at=timezone.now())
+
+
+def enqueue_job(kind):
+    """Queue a job of ``kind`` and start it in the background.
+
+    Returns ``(job, created)``. When a job of the same kind is already queued
+    or running, that job is returned instead of starting a parallel one.
+    """
+    if kind not in JOB_STEPS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    _expire_stale_jobs(kind)
+    try:
+        with transaction.atomic():
+            job = PipelineJob.objects.create(kind=kind)
+    except IntegrityError:
+        active = PipelineJob.objects.filter(kind=kind, status__in=PipelineJob.ACTIVE_STATUSES).first()
+        if active is not None:
+            return active, False
+        raise
+    transaction.on_commit(
+        lambda: threading.Thread(target=run_job, args=(job.pk,), daemon=True).start()
+    )
+    return job, True
+
+
+def _heartbeat(job_id, stop):
+    try:
+        while not stop.wait(HEARTBEAT_SECONDS):
+            PipelineJob.objects.filter(pk=job_id).update(heartbeat_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def run_job(job_id):
+    """Run every step of a queued job, recording progress on the job row.
+
+    A second thread keeps the job's heartbeat fresh for as long as it runs,
+    including within a single long step.
+    """
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_id, stop), daemon=True).start()
+    try:
+        _run_steps(PipelineJob.objects.get(pk=job_id))
+    finally:
+        stop.set()
+        # Worker threads own their DB connection; don't leak it
+        connection.close()
+
+
+def _run_steps(job):
+    job.status = 'running'
+    job.started_at = job.heartbeat_at = timezone.now()
+    job.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+
+    results = {}
+    try:
+        for key, label, step in JOB_STEPS[job.kind]:
+            job.progress = label
+            job.heartbeat_at = timezone.now()
+            job.save(update_fields=['progress', 'heartbeat_at'])
+            results[key] = step()
+        job.status = 'succeeded'
+        job.progress = 'Done'
+    except Exception as e:
+        logger.exception("Pipeline job %s failed", job.pk)
+        job.status = 'failed'
+        job.error = str(e)
+    job.result = results
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'result', 'error', 'finished_at'])
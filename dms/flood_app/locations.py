@@ -0,0 +1,113 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from .models import Location
+
+# Seconds an in-process index is reused before Location is read again; saves
+# in this process rebuild it immediately (see flood_app.signals).
+INDEX_TTL = 300
+
+
+def normalize(text):
+    """Lower-case ``text`` and reduce punctuation and whitespace to single spaces."""
+    return ' '.join(re.sub(r'[^\w]+', ' ', text.lower()).split())
+
+
+class LocationIndex:
+    """Sorted in-memory index of station names, display names and aliases.
+
+    Every word of every key is indexed as a suffix ('bagmati river' for
+    'Kathmandu (Bagmati River)'), so a bisect over the sorted keys answers
+    prefix and word-prefix searches without touching the database.
+    """
+
+    def __init__(self, rows):
+        # rows: (id, name, display_name, aliases)
+        self.by_name = {}
+        self.names = {}
+        keys = {}
+        for location_id, name, display_name, aliases in rows:
+            self.by_name[name] = location_id
+            self.names[location_id] = name
+            for label in [name, display_name, *(aliases or [])]:
+                words = normalize(label).split()
+                for i in range(len(words)):
+                    # Keys from the start of a label rank ahead of inner words
+                    keys.setdefault((' '.join(words[i:]), location_id), i)
+        entries = sorted(keys)
+        self.keys = [key for key, _ in entries]
+        self.ids = [location_id for _, location_id in entries]
+        self.exact = {}
+        for (key, location_id), offset in keys.items():
+            if offset == 0:
+                self.exact.setdefault(key, set()).add(location_id)
+
+    def search(self, text, limit=10):
+        """Ids of stations with a name, alias or word starting with ``text``."""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        found = []
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            if self.ids[i] not in found:
+                found.append(self.ids[i])
+                if len(found) >= limit:
+                    break
+            i += 1
+        return found
+
+    def resolve(self, text):
+        """The single station ``text`` refers to, or None if unknown or ambiguous.
+
+        Canonical names, display names and aliases match exactly; otherwise
+        ``text`` must be the prefix of exactly one station.
+        """
+        if text in self.by_name:
+            return self.by_name[text]
+        key = normalize(text)
+        exact = self.exact.get(key, set())
+        if len(exact) == 1:
+            return next(iter(exact))
+        if exact:
+            return None
+        candidates = self.search(key, limit=2)
+        return candidates[0] if len(candidates) == 1 else None
+
+
+_index = None
+_built_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index():
+    global _index, _built_at
+    if _index is None or time.monotonic() - _built_at > INDEX_TTL:
+        with _lock:
+            if _index is None or time.monotonic() - _built_at > INDEX_TTL:
+                _index = LocationIndex(
+                    Location.objects.order_by().values_list('id', 'name', 'display_name', 'aliases')
+                )
+                _built_at = time.monotonic()
+    return _index
+
+
+def invalidate():
+    global _index
+    _index = None
+
+
+def search_locations(text, limit=10):
+    return get_index().search(text, limit)
+
+
+def resolve_location(text):
+    """Location id for free text such as a profile's town, or None."""
+    return get_index().resolve(text) if text else None
+
+
+def station_id(name):
+    """Location id for a canonical station name, as stored in WeatherData.location."""
+    return get_index().by_name.get(name)
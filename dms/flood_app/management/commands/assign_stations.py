@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from flood_app.stations import ASSIGN_CHUNK_SIZE, assign_stations
+import time
+
+
+class Command(BaseCommand):
+    help = 'Geocodes user profiles from the bundled gazetteer and stores their nearest monitored station'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reassign', action='store_true',
+                            help='Recompute every profile, not only those without a station')
+        parser.add_argument('--chunk-size', type=int, default=ASSIGN_CHUNK_SIZE, help='Profiles per batch')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        assigned, unresolved = assign_stations(reassign=options['reassign'], chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Assigned stations to {assigned} profiles in {elapsed:.2f}s; {unresolved} locations not found"
+        ))
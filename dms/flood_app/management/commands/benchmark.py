@@ -0,0 +1,246 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test.utils import override_settings
+from flood_app.basins import BasinGraph
+from flood_app.features import add_upstream_features, compute_features
+from flood_app.ingest import frame_to_columns
+from flood_app.predict import GROUPINGS, fit_flood_model
+from flood_app.send_alerts import AlertDispatcher, AlertMessage, FakeProvider
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+
+def legacy_frame_to_rows(frame):
+    """Row-by-row conversion used by collect_weather_data before frame_to_columns."""
+    rows = []
+    for timestamp, row in frame.iterrows():
+        rows.append({
+            'recorded_at': timestamp,
+            'rainfall': row['prcp'] if not pd.isna(row['prcp']) else 0,
+            'temperature': row['temp'] if not pd.isna(row['temp']) else 0
+        })
+    return rows
+
+
+def synthetic_hourly_frame(n_rows, seed=42):
+    """Build a frame shaped like Meteostat's Hourly output, with some gaps."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2005-01-01', periods=n_rows, freq='h', name='time')
+    temp = rng.normal(20, 6, n_rows)
+    prcp = rng.gamma(0.3, 2.0, n_rows)
+    temp[rng.random(n_rows) < 0.05] = np.nan
+    prcp[rng.random(n_rows) < 0.10] = np.nan
+    return pd.DataFrame({'temp': temp, 'prcp': prcp, 'rhum': rng.uniform(40, 100, n_rows)}, index=index)
+
+
+def synthetic_feature_frames(locations, hours):
+    """Feature frames for ``locations`` synthetic stations, ``hours`` long each."""
+    frames = {}
+    for i in range(locations):
+        weather = synthetic_hourly_frame(hours, seed=i)
+        raw = pd.DataFrame({
+            'rain': weather['prcp'].fillna(0.0).to_numpy(),
+            'temperature': weather['temp'].to_numpy(),
+            'reported': np.nan,
+        }, index=weather.index.tz_localize('UTC'))
+        frames[f'Station {i}'] = compute_features(raw)
+    # No river graph: the upstream columns are present but zero
+    return add_upstream_features(frames, BasinGraph([]))
+
+
+def sqlite_wrapper(path, transaction_mode=None):
+    """A standalone Django SQLite connection to ``path``, outside settings.DATABASES."""
+    options = {'transaction_mode': transaction_mode} if transaction_mode else {}
+    settings_dict = connections.configure_settings({
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'OPTIONS': options},
+    })['default']
+    return SQLiteDatabaseWrapper(settings_dict, alias='benchmark')
+
+
+class SQLiteLoad:
+    """Ingestion writers, alert writers and dashboard readers sharing one SQLite file."""
+
+    def __init__(self, path, transaction_mode, seconds, readers):
+        self.path = path
+        self.transaction_mode = transaction_mode
+        self.seconds = seconds
+        self.readers = readers
+        self.counts = {'writes': 0, 'reads': 0, 'locked': 0, 'read_seconds': 0.0}
+        self._lock = threading.Lock()
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.counts[key] += value
+
+    def setup(self, rows):
+        wrapper = sqlite_wrapper(self.path)
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE weather (id INTEGER PRIMARY KEY, location TEXT, '
+                           'recorded_at INTEGER, temperature REAL, rainfall REAL)')
+            cursor.execute('CREATE INDEX weather_location_time ON weather (location, recorded_at)')
+            cursor.execute('CREATE TABLE alerts (id INTEGER PRIMARY KEY, location TEXT, created_at REAL)')
+            cursor.executemany(
+                'INSERT INTO weather (location, recorded_at, temperature, rainfall) VALUES (%s, %s, %s, %s)',
+                [(f'city-{i % 20}', i // 20, 20.0, 1.0) for i in range(rows)],
+            )
+        wrapper.close()
+
+    def _loop(self, work):
+        wrapper = sqlite_wrapper(self.path, self.transaction_mode)
+        deadline = time.monotonic() + self.seconds
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    work(wrapper)
+                except OperationalError as e:
+                    if 'locked' not in str(e) and 'busy' not in str(e):
+                        raise
+                    self._count(locked=1)
+                    wrapper.close()
+        finally:
+            wrapper.close()
+
+    def _ingest(self, wrapper):
+        # Batch upsert like collect_weather_data: one transaction per city batch
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'BEGIN {self.transaction_mode or ""}')
+            cursor.executemany(
+                'INSERT INTO weather (location, recorded_at, temperature, rainfall) VALUES (%s, %s, %s, %s)',
+                [('city-0', 10**9 + i, 21.0, 0.5) for i in range(500)],
+            )
+            cursor.execute('COMMIT')
+        self._count(writes=1)
+
+    def _alert(self, wrapper):
+        # Read-then-write, like recording alert deliveries against the ledger
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'BEGIN {self.transaction_mode or ""}')
+            cursor.execute('SELECT COUNT(*) FROM alerts WHERE location = %s', ['city-1'])
+            cursor.fetchone()
+            cursor.execute('INSERT INTO alerts (location, created_at) VALUES (%s, %s)', ['city-1', time.time()])
+            cursor.execute('COMMIT')
+        self._count(writes=1)
+
+    def _read(self, wrapper):
+        started = time.perf_counter()
+        with wrapper.cursor() as cursor:
+            cursor.execute(
+                'SELECT location, SUM(rainfall), AVG(temperature) FROM weather '
+                'WHERE location = %s AND recorded_at >= %s GROUP BY location',
+                ['city-5', 1000],
+            )
+            cursor.fetchall()
+        self._count(reads=1, read_seconds=time.perf_counter() - started)
+
+    def run(self):
+        workers = [self._ingest, self._alert] + [self._read] * self.readers
+        threads = [threading.Thread(target=self._loop, args=(work,)) for work in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.counts
+
+
+class Command(BaseCommand):
+    help = 'Runs micro-benchmarks for the flood pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=['frame', 'alerts', 'sqlite', 'training'], help='Benchmark to run')
+        parser.add_argument('--rows', type=int, default=175_320, help='frame: hourly rows per city (default: 20 years)')
+        parser.add_argument('--repeat', type=int, default=3, help='frame: runs per variant; the best time is reported')
+        parser.add_argument('--messages', type=int, default=2000, help='alerts: messages to dispatch')
+        parser.add_argument('--latency', type=float, default=0.05, help='alerts: simulated provider latency in seconds')
+        parser.add_argument('--rate', type=float, default=100.0, help='alerts: token-bucket rate in messages/sec')
+        parser.add_argument('--workers', type=int, default=16, help='alerts: dispatcher threads; sqlite: reader threads')
+        parser.add_argument('--seconds', type=float, default=5.0, help='sqlite: duration of each load run')
+        parser.add_argument('--locations', type=int, default=20, help='training: synthetic stations')
+        parser.add_argument('--days', type=int, default=365, help='training: days of hourly history per station')
+        parser.add_argument('--grouping', choices=GROUPINGS[1:], default='location', help='training: per-group models to fit')
+
+    def timed(self, func, *args, repeat=3):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(*args)
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    def bench_frame(self, options):
+        rows, repeat = options['rows'], options['repeat']
+        frame = synthetic_hourly_frame(rows)
+        legacy = self.timed(legacy_frame_to_rows, frame, repeat=repeat)
+        vectorized = self.timed(frame_to_columns, frame, repeat=repeat)
+        self.stdout.write(f"Meteostat frame conversion, {rows} rows:")
+        self.stdout.write(f"  iterrows:   {legacy:8.3f}s ({rows / legacy:,.0f} rows/sec)")
+        self.stdout.write(f"  vectorized: {vectorized:8.3f}s ({rows / vectorized:,.0f} rows/sec)")
+        self.stdout.write(self.style.SUCCESS(f"✅ Speedup: {legacy / vectorized:.1f}x"))
+
+    def bench_alerts(self, options):
+        count, latency = options['messages'], options['latency']
+        messages = [AlertMessage('Benchmark', None, 1, i, f"+97798{i:08d}", "Benchmark alert") for i in range(count)]
+        provider = FakeProvider(latency=latency)
+        dispatcher = AlertDispatcher(provider=provider, rate=options['rate'], workers=options['workers'])
+        started = time.perf_counter()
+        results = dispatcher.dispatch(messages)
+        elapsed = time.perf_counter() - started
+        sent = sum(result.status == 'sent' for result in results)
+        self.stdout.write(f"Alert dispatch, {count} messages at {latency * 1000:.0f}ms provider latency:")
+        self.stdout.write(f"  serial estimate: {count * latency:8.2f}s")
+        self.stdout.write(f"  dispatcher:      {elapsed:8.2f}s ({sent / elapsed:,.1f} msg/sec, "
+                          f"limit {options['rate']:g}/sec, {options['workers']} workers)")
+        self.stdout.write(self.style.SUCCESS(f"✅ {sent}/{count} delivered"))
+
+    def bench_sqlite(self, options):
+        seconds, readers = options['seconds'], min(options['workers'], 8)
+        variants = [
+            # Django's stock SQLite connection: rollback journal, deferred transactions
+            ('default', {}, None),
+            ('tuned', settings.SQLITE_PRAGMAS,
+             settings.DATABASES['default'].get('OPTIONS', {}).get('transaction_mode')),
+        ]
+        self.stdout.write(f"SQLite under concurrent load, {seconds:g}s per run, "
+                          f"2 writers + {readers} readers, {options['rows']} seed rows:")
+        with tempfile.TemporaryDirectory() as directory:
+            for name, pragmas, transaction_mode in variants:
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    load = SQLiteLoad(os.path.join(directory, f'{name}.sqlite3'), transaction_mode, seconds, readers)
+                    load.setup(options['rows'])
+                    counts = load.run()
+                latency = counts['read_seconds'] / counts['reads'] * 1000 if counts['reads'] else float('nan')
+                self.stdout.write(
+                    f"  {name:8s} {counts['reads'] / seconds:9,.0f} reads/sec ({latency:.2f}ms avg), "
+                    f"{counts['writes'] / seconds:6,.0f} write txns/sec, {counts['locked']} 'database is locked' errors"
+                )
+                if pragmas:
+                    self.stdout.write(f"           {', '.join(f'{k}={v}' for k, v in pragmas.items())}, "
+                                      f"transaction_mode={transaction_mode}")
+
+    def bench_training(self, options):
+        frames = synthetic_feature_frames(options['locations'], options['days'] * 24)
+        cores = os.cpu_count() or 1
+        counts = sorted({1, cores} | {2 ** i for i in range(1, cores.bit_length()) if 2 ** i < cores})
+        self.stdout.write(f"Flood model training, {options['locations']} stations x {options['days']} days, "
+                          f"{cores} CPUs:")
+        started = time.perf_counter()
+        fit_flood_model(frames, 'global')
+        baseline = time.perf_counter() - started
+        self.stdout.write(f"  global model:             {baseline:8.2f}s")
+        for workers in counts:
+            started = time.perf_counter()
+            model, _, _, _ = fit_flood_model(frames, options['grouping'], workers=workers, min_samples=0)
+            elapsed = time.perf_counter() - started
+            if workers == 1:
+                serial = elapsed
+            self.stdout.write(f"  per-{options['grouping']}, {workers:2d} worker(s): {elapsed:8.2f}s "
+                              f"({len(model.models)} group models, {serial / elapsed:.1f}x vs 1 worker)")
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['suite']}")(options)
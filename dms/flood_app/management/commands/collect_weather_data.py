@@ -1,114 +1,158 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
 from meteostat import Point, Hourly
-from flood_app.models import WeatherData, FloodPrediction
-from flood_app.predict import train_predict_model
+from flood_app.models import Location, WeatherData, WeatherRollup, FloodPrediction
+from flood_app.predict import run_predictions, update_model
+from flood_app.outbound import get_session, metrics
+from flood_app.ingest import WeatherColumns, frame_to_columns, upsert_weather_columns
+from flood_app.rollups import refresh_rollups
+from flood_app.retention import delete_in_chunks
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime
-import pandas as pd
-import requests
+import time
 
 class Command(BaseCommand):
     help = 'Collects historical weather data and updates flood predictions for Nepal'
+    retry_backoff = 1.0  # Seconds before the first retry; doubled on each attempt
 
     def add_arguments(self, parser):
         parser.add_argument('--use-weatherapi', action='store_true', help='Use WeatherAPI.com instead of Meteostat')
+        parser.add_argument('--workers', type=int, default=4, help='Number of cities fetched concurrently')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+        parser.add_argument('--retries', type=int, default=3, help='Attempts per city before giving up')
+        parser.add_argument('--full', action='store_true', help='Re-fetch the full 30-day window instead of only new data')
 
-    def fetch_weatherapi_data(self, location, start, end):
-        """Fetch historical weather data from WeatherAPI.com."""
-        try:
-            api_key = settings.WEATHERAPI_KEY
-            url = f'http://api.weatherapi.com/v1/history.json?key={api_key}&q={location}&dt={start.strftime("%Y-%m-%d")}&end_dt={end.strftime("%Y-%m-%d")}'
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            forecast = data['forecast']['forecastday']
-            weather_data = []
-            for day in forecast:
-                date = datetime.datetime.strptime(day['date'], '%Y-%m-%d')
-                weather_data.append({
-                    'recorded_at': date,
-                    'rainfall': day['day'].get('totalprecip_mm', 0.0),
-                    'temperature': day['day'].get('avgtemp_c', 0.0)
-                })
-            return weather_data
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"WeatherAPI failed for {location}: {str(e)}"))
-            return []
-
-    def fetch_meteostat_data(self, location, point, start, end):
-        """Fetch historical weather data from Meteostat."""
-        try:
-            data = Hourly(point, start, end).fetch()
-            if data.empty:
-                self.stdout.write(self.style.WARNING(f"No Meteostat data for {location}"))
-                return []
-            weather_data = []
-            for timestamp, row in data.iterrows():
-                weather_data.append({
-                    'recorded_at': timestamp,
-                    'rainfall': row['prcp'] if not pd.isna(row['prcp']) else 0,
-                    'temperature': row['temp'] if not pd.isna(row['temp']) else 0
-                })
-            return weather_data
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Meteostat failed for {location}: {str(e)}"))
-            return []
+    def fetch_weatherapi_data(self, location, start, end, timeout=30.0):
+        """Fetch historical weather data from WeatherAPI.com.
+
+        fetch_city already retries with backoff, so the session doesn't retry too.
+        """
+        api_key = settings.WEATHERAPI_KEY
+        url = f'http://api.weatherapi.com/v1/history.json?key={api_key}&q={location}&dt={start.strftime("%Y-%m-%d")}&end_dt={end.strftime("%Y-%m-%d")}'
+        response = get_session(retries=0).get(url, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        forecast = data['forecast']['forecastday']
+        return WeatherColumns(
+            recorded_at=[datetime.datetime.strptime(day['date'], '%Y-%m-%d') for day in forecast],
+            temperature=[float(day['day'].get('avgtemp_c', 0.0)) for day in forecast],
+            rainfall=[float(day['day'].get('totalprecip_mm', 0.0)) for day in forecast],
+        )
+
+    def fetch_meteostat_data(self, location, point, start, end, timeout=30.0):
+        """Fetch historical weather data from Meteostat.
+
+        Meteostat manages its own downloads, so ``timeout`` is not applied here.
+        """
+        data = Hourly(point, start, end).fetch()
+        if data.empty:
+            self.stdout.write(self.style.WARNING(f"No Meteostat data for {location}"))
+            return WeatherColumns([], [], [])
+        return frame_to_columns(data)
+
+    def fetch_city(self, city, point, start, end, use_weatherapi=False, timeout=30.0, retries=3):
+        """Fetch one city, retrying failed attempts with exponential backoff."""
+        source = 'WeatherAPI' if use_weatherapi else 'Meteostat'
+        for attempt in range(1, retries + 1):
+            try:
+                if use_weatherapi:
+                    return self.fetch_weatherapi_data(city.split(' (')[0], start, end, timeout=timeout)
+                return self.fetch_meteostat_data(city, point, start, end, timeout=timeout)
+            except Exception as e:
+                if attempt == retries:
+                    self.stdout.write(self.style.ERROR(f"{source} failed for {city}: {str(e)}"))
+                    return WeatherColumns([], [], [])
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+                self.stdout.write(self.style.WARNING(
+                    f"{source} attempt {attempt} failed for {city}, retrying in {delay:.1f}s: {str(e)}"
+                ))
+                time.sleep(delay)
 
     def handle(self, *args, **options):
         use_weatherapi = options.get('use_weatherapi', False)
+        workers = max(1, options.get('workers') or 4)
+        timeout = options.get('timeout') or 30.0
+        retries = max(1, options.get('retries') or 3)
+        full = options.get('full', False)
 
-        # Define cities and coordinates
+        # Monitored stations and their coordinates
         cities = {
-            'Kathmandu (Bagmati River)': Point(27.7152, 85.3240),
-            'Banepa (Roshi River, tributary of Bagmati)': Point(27.6325, 85.5219),
-            'Birgunj (Bagmati River)': Point(27.0000, 84.8667),
-            'Pokhara (Seti River, tributary of Gandaki)': Point(28.2096, 83.9856),
-            'Butwal (Tinau River, Gandaki Basin)': Point(27.7000, 83.4500),
-            'Baglung (West Rapti River)': Point(28.2744, 83.5895),
-            'Biratnagar (Koshi River)': Point(26.4525, 87.2718),
-            'Rajbiraj (Kamala River, Koshi Basin)': Point(26.5367, 86.7458),
-            'Ilam (Mai River, tributary of Koshi)': Point(26.9111, 87.9283),
-            'Gulariya (Karnali River)': Point(28.0429, 81.5702),
-            'Surkhet (Bheri River, Karnali tributary)': Point(28.6167, 81.6167),
-            'Jumla (Karnali upstream)': Point(29.2733, 82.1903),
-            'Dhangadhi (Mahakali River)': Point(28.6833, 80.6000),
-            'Mahendranagar (Mahakali River)': Point(29.0032, 80.5207),
-            'Tulsipur (West Rapti River)': Point(28.2530, 82.3375),
-            'Dang (Rapti River)': Point(27.9333, 82.4667),
-            'Nepalgunj (Babai River)': Point(28.0500, 81.6167),
-            'Dhulikhel (Near Roshi River)': Point(27.6227, 85.5392),
-            'Janakpur (Kamala River)': Point(26.7161, 85.9214),
-            'Bharatpur (Narayani River)': Point(27.6833, 84.4333),
+            name: Point(latitude, longitude)
+            for name, latitude, longitude in Location.objects.values_list('name', 'latitude', 'longitude')
         }
+        if not cities:
+            # Never treat an empty station table as "every location was removed"
+            self.stdout.write(self.style.ERROR("No monitored locations configured; run migrations first."))
+            return
 
-        # Cleanup old data
+        # Cleanup data for removed locations in small batches, so the
+        # delete doesn't hold the SQLite write lock for its whole duration
         city_names = list(cities.keys())
-        WeatherData.objects.exclude(location__in=city_names).delete()
-        FloodPrediction.objects.exclude(location__in=city_names).delete()
-        self.stdout.write(self.style.SUCCESS("✅ Old data for removed locations cleaned up."))
-
-        # Set date range (last 30 days)
-        end = datetime.datetime.now()
-        start = end - datetime.timedelta(days=30)
-
-        # Collect data
-        for city, point in cities.items():
-            if use_weatherapi:
-                weather_data = self.fetch_weatherapi_data(city.split(' (')[0], start, end)
-            else:
-                weather_data = self.fetch_meteostat_data(city, point, start, end)
-
-            for data in weather_data:
-                WeatherData.objects.update_or_create(
-                    location=city,
-                    recorded_at=data['recorded_at'],
-                    defaults={
-                        'temperature': data['temperature'],
-                        'rainfall': data['rainfall']
-                    }
-                )
-            self.stdout.write(self.style.SUCCESS(f"Collected data for {city}"))
-
-        # Run predictions
-        train_predict_model()
+        removed = sum(
+            delete_in_chunks(model.objects.exclude(location__in=city_names))
+            for model in (WeatherData, WeatherRollup, FloodPrediction)
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Old data for removed locations cleaned up ({removed} rows)."))
+
+        # Set date range (last 30 days). Meteostat expects naive UTC datetimes.
+        end = timezone.now().replace(tzinfo=None)
+        window_start = end - datetime.timedelta(days=30)
+
+        # Unless --full is given, only fetch what arrived after each city's
+        # latest stored reading (one aggregated query for all cities).
+        latest = {}
+        if not full:
+            latest = dict(
+                WeatherData.objects.filter(location__in=city_names)
+                .order_by().values('location').annotate(latest=Max('recorded_at'))
+                .values_list('location', 'latest')
+            )
+        windows = {}
+        for city in city_names:
+            start = window_start
+            if city in latest:
+                start = max(start, latest[city].astimezone(datetime.timezone.utc).replace(tzinfo=None))
+            if end - start < datetime.timedelta(hours=1):
+                self.stdout.write(f"{city} is up to date.")
+                continue
+            windows[city] = start
+
+        # Fetch concurrently, but keep every DB write on this thread: SQLite
+        # only allows a single writer.
+        total_rows = 0
+        write_seconds = 0.0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.fetch_city, city, cities[city], start, end,
+                                use_weatherapi=use_weatherapi, timeout=timeout, retries=retries): city
+                for city, start in windows.items()
+            }
+            for future in as_completed(futures):
+                city = futures[future]
+                weather_data = future.result()
+
+                started = time.perf_counter()
+                created, updated = upsert_weather_columns(city, weather_data)
+                if created or updated:
+                    refresh_rollups(city, since=min(weather_data.recorded_at))
+                elapsed = time.perf_counter() - started
+                total_rows += len(weather_data)
+                write_seconds += elapsed
+                self.stdout.write(self.style.SUCCESS(
+                    f"Collected data for {city} since {windows[city]:%Y-%m-%d %H:%M}: "
+                    f"{created} new, {updated} updated ({len(weather_data)} rows in {elapsed:.2f}s)"
+                ))
+
+        rate = total_rows / write_seconds if write_seconds else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Stored {total_rows} rows in {write_seconds:.2f}s ({rate:.0f} rows/sec)."
+        ))
+        if use_weatherapi:
+            self.stdout.write(f"Outbound HTTP: {metrics.summary()}")
+
+        # Retrain (or, with FLOOD_INCREMENTAL, learn from the new rows) and run predictions
+        if update_model():
+            run_predictions()
         self.stdout.write(self.style.SUCCESS("✅ Flood prediction model trained and predictions updated."))
\ No newline at end of file
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from flood_app.retention import run_retention
+import time
+
+
+def format_bytes(size):
+    if size is None:
+        return 'unknown'
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+class Command(BaseCommand):
+    help = 'Deletes weather and rainfall history past its retention period and compacts the database'
+
+    def add_arguments(self, parser):
+        vacuum = parser.add_mutually_exclusive_group()
+        vacuum.add_argument('--vacuum', dest='vacuum', action='store_true', default=None,
+                            help='Always VACUUM after pruning')
+        vacuum.add_argument('--no-vacuum', dest='vacuum', action='store_false',
+                            help='Only ANALYZE after pruning')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"Keeping raw readings for {settings.RETENTION_RAW_DAYS or 'all'} days, "
+            f"rollups for {settings.RETENTION_ROLLUP_DAYS or 'all'} days "
+            f"and rainfall reports for {settings.RETENTION_REPORT_DAYS or 'all'} days."
+        )
+        started = time.perf_counter()
+        report = run_retention(vacuum=options['vacuum'])
+        elapsed = time.perf_counter() - started
+        for table, rows in report['deleted'].items():
+            self.stdout.write(f"{table}: {rows} rows deleted")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {'Vacuumed' if report['vacuumed'] else 'Analyzed'} in {elapsed:.2f}s: "
+            f"{format_bytes(report['size_before'])} -> {format_bytes(report['size_after'])} "
+            f"({format_bytes(report['reclaimed'])} reclaimed)"
+        ))
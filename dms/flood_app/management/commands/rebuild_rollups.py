@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from flood_app.rollups import rebuild_rollups
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily and weekly WeatherData rollups from the raw hourly readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--location', action='append',
+                            help='Location to rebuild (repeatable); defaults to every location with data')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_rollups(options['location'])
+        for location, (daily, weekly) in sorted(written.items()):
+            self.stdout.write(f"{location}: {daily} daily, {weekly} weekly rows")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt rollups for {len(written)} locations in {elapsed:.2f}s"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from flood_app.models import CronJobLog
+import datetime
+import time
+
+
+class Command(BaseCommand):
+    help = 'Runs the jobs in settings.CRON_CLASSES whose interval has passed; call it every few minutes from crontab'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Run every job now, whatever its schedule')
+
+    def handle(self, *args, **options):
+        ran = 0
+        for path in settings.CRON_CLASSES:
+            job_class = import_string(path)
+            last_run = CronJobLog.objects.filter(code=job_class.code).values_list('created_at', flat=True).first()
+            interval = datetime.timedelta(minutes=job_class.schedule.run_every_mins)
+            if not options['force'] and last_run is not None and timezone.now() - last_run < interval:
+                continue
+            # Logged before running, so an overlapping invocation doesn't start it again
+            CronJobLog.objects.create(code=job_class.code)
+            started = time.perf_counter()
+            job_class().do()
+            self.stdout.write(f"{job_class.code}: {time.perf_counter() - started:.2f}s")
+            ran += 1
+        self.stdout.write(self.style.SUCCESS(f"✅ Ran {ran} of {len(settings.CRON_CLASSES)} scheduled jobs"))
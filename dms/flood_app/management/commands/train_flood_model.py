@@ -1,9 +1,31 @@
 from django.core.management.base import BaseCommand
-from flood_app.predict import train_predict_model
+from flood_app.predict import GROUPINGS, run_predictions, train_model, update_model
 
 class Command(BaseCommand):
     help = 'Train flood prediction model for all cities and forecast for next 7 days'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild-features', action='store_true', help='Recompute the cached feature matrix from scratch')
+        parser.add_argument('--from-parquet', metavar='DIR', help='Train on history exported by export_parquet instead of the database')
+        parser.add_argument('--grouping', choices=GROUPINGS, help='Fit one global model, or one per location or basin (default: FLOOD_MODEL_GROUPING)')
+        parser.add_argument('--workers', type=int, help='Processes used to fit per-group models (default: FLOOD_TRAINING_WORKERS)')
+        parser.add_argument('--update', action='store_true', help='With FLOOD_INCREMENTAL, only learn from rows labelled since the last update')
+
     def handle(self, *args, **kwargs):
-        train_predict_model()
+        if kwargs.get('update'):
+            trained = update_model()
+        else:
+            trained = train_model(rebuild_features=kwargs.get('rebuild_features', False),
+                                  parquet_root=kwargs.get('from_parquet'),
+                                  grouping=kwargs.get('grouping'), workers=kwargs.get('workers'))
+        if not trained:
+            self.stdout.write(self.style.WARNING("⚠️ Flood prediction training skipped: not enough data."))
+            return
         self.stdout.write(self.style.SUCCESS("✅ Flood prediction training completed."))
+
+        result = run_predictions()
+        if not result:
+            self.stdout.write(self.style.WARNING("⚠️ No features available for forecasting."))
+            return
+        timings = ', '.join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in result['timings'].items())
+        self.stdout.write(self.style.SUCCESS(f"✅ Stored {result['predictions']} predictions ({timings})."))
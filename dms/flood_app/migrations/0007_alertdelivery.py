@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0006_pipelinejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=100)),
+                ('predicted_date', models.DateTimeField()),
+                ('channel', models.CharField(default='sms', max_length=20)),
+                ('severity_level', models.IntegerField()),
+                ('status', models.CharField(choices=[('sent', 'Sent'), ('failed', 'Failed')], max_length=20)),
+                ('provider_message_id', models.CharField(blank=True, max_length=100)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_deliveries', to='flood_app.userprofile')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(fields=('location', 'predicted_date', 'recipient', 'channel'), name='unique_alert_delivery')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0007_alertdelivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelEvaluation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.IntegerField(unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('n_train', models.IntegerField()),
+                ('n_test', models.IntegerField()),
+                ('training_seconds', models.FloatField()),
+                ('accuracy', models.FloatField()),
+                ('brier_score', models.FloatField(blank=True, null=True)),
+                ('confusion_matrix', models.JSONField()),
+                ('per_class', models.JSONField()),
+                ('calibration', models.JSONField()),
+            ],
+            options={
+                'ordering': ['-version'],
+            },
+        ),
+    ]
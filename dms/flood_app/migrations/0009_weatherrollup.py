@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0008_modelevaluation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=100)),
+                ('granularity', models.CharField(choices=[('day', 'Daily'), ('week', 'Weekly')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('rain_sum', models.FloatField()),
+                ('rain_max', models.FloatField()),
+                ('temp_mean', models.FloatField()),
+                ('samples', models.IntegerField()),
+            ],
+            options={
+                'ordering': ['location', 'granularity', 'period_start'],
+                'constraints': [models.UniqueConstraint(fields=('location', 'granularity', 'period_start'), name='unique_weather_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0009_weatherrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('display_name', models.CharField(max_length=100)),
+                ('river', models.CharField(blank=True, max_length=100)),
+                ('basin', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('aliases', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='floodalert',
+            name='station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alerts', to='flood_app.location'),
+        ),
+        migrations.AddField(
+            model_name='floodprediction',
+            name='station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='predictions', to='flood_app.location'),
+        ),
+        migrations.AddField(
+            model_name='rainfalldata',
+            name='station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rainfall_reports', to='flood_app.location'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profiles', to='flood_app.location'),
+        ),
+        migrations.AddField(
+            model_name='weatherdata',
+            name='station',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='weather_data', to='flood_app.location'),
+        ),
+        migrations.AddIndex(
+            model_name='floodalert',
+            index=models.Index(fields=['station', '-created_at'], name='flood_app_f_station_a344ae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='floodprediction',
+            index=models.Index(fields=['station', 'predicted_date'], name='flood_app_f_station_90608e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['station', '-recorded_at'], name='flood_app_w_station_658ad6_idx'),
+        ),
+    ]
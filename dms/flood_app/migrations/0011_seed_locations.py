@@ -0,0 +1,99 @@
+import re
+
+from django.db import migrations
+
+# The monitored stations from collect_weather_data, with river and basin as
+# given in their labels: (name, display name, river, basin, lat, lon, aliases)
+STATIONS = [
+    ('Kathmandu (Bagmati River)', 'Kathmandu', 'Bagmati', 'Bagmati', 27.7152, 85.3240, ['KTM']),
+    ('Banepa (Roshi River, tributary of Bagmati)', 'Banepa', 'Roshi', 'Bagmati', 27.6325, 85.5219, []),
+    ('Birgunj (Bagmati River)', 'Birgunj', 'Bagmati', 'Bagmati', 27.0000, 84.8667, ['Birganj']),
+    ('Pokhara (Seti River, tributary of Gandaki)', 'Pokhara', 'Seti', 'Gandaki', 28.2096, 83.9856, []),
+    ('Butwal (Tinau River, Gandaki Basin)', 'Butwal', 'Tinau', 'Gandaki', 27.7000, 83.4500, []),
+    ('Baglung (West Rapti River)', 'Baglung', 'West Rapti', 'West Rapti', 28.2744, 83.5895, []),
+    ('Biratnagar (Koshi River)', 'Biratnagar', 'Koshi', 'Koshi', 26.4525, 87.2718, []),
+    ('Rajbiraj (Kamala River, Koshi Basin)', 'Rajbiraj', 'Kamala', 'Koshi', 26.5367, 86.7458, []),
+    ('Ilam (Mai River, tributary of Koshi)', 'Ilam', 'Mai', 'Koshi', 26.9111, 87.9283, []),
+    ('Gulariya (Karnali River)', 'Gulariya', 'Karnali', 'Karnali', 28.0429, 81.5702, ['Bardiya']),
+    ('Surkhet (Bheri River, Karnali tributary)', 'Surkhet', 'Bheri', 'Karnali', 28.6167, 81.6167, ['Birendranagar']),
+    ('Jumla (Karnali upstream)', 'Jumla', 'Karnali', 'Karnali', 29.2733, 82.1903, ['Khalanga']),
+    ('Dhangadhi (Mahakali River)', 'Dhangadhi', 'Mahakali', 'Mahakali', 28.6833, 80.6000, ['Dhangadi']),
+    ('Mahendranagar (Mahakali River)', 'Mahendranagar', 'Mahakali', 'Mahakali', 29.0032, 80.5207, ['Bhimdatta']),
+    ('Tulsipur (West Rapti River)', 'Tulsipur', 'West Rapti', 'West Rapti', 28.2530, 82.3375, []),
+    ('Dang (Rapti River)', 'Dang', 'Rapti', 'West Rapti', 27.9333, 82.4667, ['Ghorahi']),
+    ('Nepalgunj (Babai River)', 'Nepalgunj', 'Babai', 'Babai', 28.0500, 81.6167, ['Nepalganj']),
+    ('Dhulikhel (Near Roshi River)', 'Dhulikhel', 'Roshi', 'Bagmati', 27.6227, 85.5392, []),
+    ('Janakpur (Kamala River)', 'Janakpur', 'Kamala', 'Koshi', 26.7161, 85.9214, ['Janakpurdham']),
+    ('Bharatpur (Narayani River)', 'Bharatpur', 'Narayani', 'Gandaki', 27.6833, 84.4333, ['Chitwan']),
+]
+
+BACKFILLED_MODELS = ['UserProfile', 'WeatherData', 'RainfallData', 'FloodPrediction', 'FloodAlert']
+
+
+def normalize(text):
+    return ' '.join(re.sub(r'[^\w]+', ' ', text.lower()).split())
+
+
+class StationResolver:
+    """Frozen copy of flood_app.locations.LocationIndex.resolve, as of this migration.
+
+    Exact names, display names and aliases win; otherwise the text must be
+    the prefix of a word run in exactly one station's labels.
+    """
+
+    def __init__(self, rows):
+        self.by_name = {}
+        self.exact = {}
+        self.suffixes = set()
+        for location_id, name, display_name, aliases in rows:
+            self.by_name[name] = location_id
+            for label in [name, display_name, *(aliases or [])]:
+                words = normalize(label).split()
+                self.exact.setdefault(' '.join(words), set()).add(location_id)
+                for i in range(len(words)):
+                    self.suffixes.add((' '.join(words[i:]), location_id))
+
+    def resolve(self, text):
+        if text in self.by_name:
+            return self.by_name[text]
+        key = normalize(text)
+        exact = self.exact.get(key, set())
+        if exact or not key:
+            return next(iter(exact)) if len(exact) == 1 else None
+        matches = {location_id for suffix, location_id in self.suffixes if suffix.startswith(key)}
+        return matches.pop() if len(matches) == 1 else None
+
+
+def seed_locations(apps, schema_editor):
+    Location = apps.get_model('flood_app', 'Location')
+    for name, display_name, river, basin, latitude, longitude, aliases in STATIONS:
+        Location.objects.update_or_create(name=name, defaults={
+            'display_name': display_name, 'river': river, 'basin': basin,
+            'latitude': latitude, 'longitude': longitude, 'aliases': aliases,
+        })
+
+    # Resolve each distinct location string once, then update its rows in bulk
+    index = StationResolver(Location.objects.values_list('id', 'name', 'display_name', 'aliases'))
+    for model_name in BACKFILLED_MODELS:
+        model = apps.get_model('flood_app', model_name)
+        values = model.objects.order_by().values_list('location', flat=True).distinct()
+        for value in list(values):
+            location_id = index.resolve(value)
+            if location_id is not None:
+                model.objects.filter(location=value, station__isnull=True).update(station_id=location_id)
+
+
+def clear_stations(apps, schema_editor):
+    for model_name in BACKFILLED_MODELS:
+        apps.get_model('flood_app', model_name).objects.update(station=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0010_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_locations, clear_stations),
+    ]
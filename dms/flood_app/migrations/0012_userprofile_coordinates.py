@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0011_seed_locations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0012_userprofile_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='downstream',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upstream', to='flood_app.location'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='travel_hours',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# River reaches between monitored stations, following the rivers and basins
+# in the station labels: (upstream, downstream, travel time in hours)
+EDGES = [
+    ('Banepa (Roshi River, tributary of Bagmati)', 'Dhulikhel (Near Roshi River)', 2),
+    ('Dhulikhel (Near Roshi River)', 'Birgunj (Bagmati River)', 20),
+    ('Kathmandu (Bagmati River)', 'Birgunj (Bagmati River)', 18),
+    ('Pokhara (Seti River, tributary of Gandaki)', 'Bharatpur (Narayani River)', 12),
+    ('Baglung (West Rapti River)', 'Tulsipur (West Rapti River)', 24),
+    ('Tulsipur (West Rapti River)', 'Dang (Rapti River)', 6),
+    ('Ilam (Mai River, tributary of Koshi)', 'Biratnagar (Koshi River)', 14),
+    ('Janakpur (Kamala River)', 'Rajbiraj (Kamala River, Koshi Basin)', 8),
+    ('Jumla (Karnali upstream)', 'Gulariya (Karnali River)', 36),
+    ('Surkhet (Bheri River, Karnali tributary)', 'Gulariya (Karnali River)', 12),
+    ('Mahendranagar (Mahakali River)', 'Dhangadhi (Mahakali River)', 6),
+]
+
+
+def seed_edges(apps, schema_editor):
+    Location = apps.get_model('flood_app', 'Location')
+    ids = dict(Location.objects.values_list('name', 'id'))
+    for upstream, downstream, hours in EDGES:
+        if upstream in ids and downstream in ids:
+            Location.objects.filter(pk=ids[upstream]).update(downstream_id=ids[downstream], travel_hours=hours)
+
+
+def clear_edges(apps, schema_editor):
+    apps.get_model('flood_app', 'Location').objects.update(downstream=None, travel_hours=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0013_location_downstream'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_edges, clear_edges),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0014_seed_basin_edges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelevaluation',
+            name='prequential',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0015_modelevaluation_prequential'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='floodalert',
+            name='predicted_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='floodalert',
+            constraint=models.UniqueConstraint(fields=('location', 'predicted_date'), name='unique_flood_alert'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 15:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flood_app', '0016_floodalert_predicted_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipelinejob',
+            name='heartbeat_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,89 @@
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+import joblib
+from django.conf import settings
+from django.utils import timezone
+
+ARTIFACT_PATTERN = re.compile(r'^flood_model_v(\d+)\.joblib$')
+
+_lock = threading.Lock()
+_cache = {'path': None, 'artifact': None}
+
+
+def model_dir():
+    path = Path(settings.FLOOD_MODEL_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def artifact_path(version):
+    return model_dir() / f'flood_model_v{version:04d}.joblib'
+
+
+def available_versions():
+    """Return the stored model versions in ascending order."""
+    versions = []
+    for entry in os.scandir(model_dir()):
+        match = ARTIFACT_PATTERN.match(entry.name)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def latest_version():
+    versions = available_versions()
+    return versions[-1] if versions else None
+
+
+def save_model(model, metadata, version=None):
+    """Persist ``model`` as ``version`` (default: the next one) and return it.
+
+    The artifact is written to a temporary file and renamed into place, so a
+    concurrent reader never sees a partial file. A JSON sidecar with the same
+    metadata is written next to it for inspection without unpickling.
+    """
+    with _lock:
+        if version is None:
+            version = (latest_version() or 0) + 1
+        metadata = {
+            **metadata,
+            'version': version,
+            'saved_at': timezone.now().isoformat(),
+        }
+        path = artifact_path(version)
+        tmp_path = path.with_suffix('.tmp')
+        joblib.dump({'model': model, 'metadata': metadata}, tmp_path)
+        os.replace(tmp_path, path)
+        path.with_suffix('.json').write_text(json.dumps(metadata, indent=2, default=str))
+        prune_versions(keep=settings.FLOOD_MODEL_KEEP_VERSIONS)
+    return version
+
+
+def prune_versions(keep):
+    for version in available_versions()[:-keep] if keep > 0 else []:
+        path = artifact_path(version)
+        path.unlink(missing_ok=True)
+        path.with_suffix('.json').unlink(missing_ok=True)
+
+
+def load_model():
+    """Return the newest stored artifact as ``{'model', 'metadata'}``, or None.
+
+    The artifact is loaded once per process and reused until a newer version
+    appears in FLOOD_MODEL_DIR.
+    """
+    version = latest_version()
+    if version is None:
+        return None
+    path = artifact_path(version)
+    if _cache['path'] == path:
+        return _cache['artifact']
+    with _lock:
+        if _cache['path'] != path:
+            _cache['artifact'] = joblib.load(path)
+            _cache['path'] = path
+        return _cache['artifact']
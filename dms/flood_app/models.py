@@ -1,5 +1,26 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+class Location(models.Model):
+    """A monitored station; rows in other tables point here through ``station``."""
+    name = models.CharField(max_length=100, unique=True)  # e.g. 'Kathmandu (Bagmati River)'
+    display_name = models.CharField(max_length=100)  # e.g. 'Kathmandu'
+    river = models.CharField(max_length=100, blank=True)
+    basin = models.CharField(max_length=50, blank=True, db_index=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    aliases = models.JSONField(default=list, blank=True)  # Other spellings accepted by search
+    # The next monitored station this river drains into, and the travel time
+    # in hours for water to get there; together they form the basin graph.
+    downstream = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='upstream')
+    travel_hours = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='userprofile')
@@ -7,6 +28,9 @@ class UserProfile(models.Model):
     phone = models.CharField(max_length=15)
     email = models.EmailField(blank=True)
     location = models.CharField(max_length=100)
+    latitude = models.FloatField(null=True, blank=True)  # Geocoded from location unless set explicitly
+    longitude = models.FloatField(null=True, blank=True)
+    station = models.ForeignKey(Location, null=True, blank=True, on_delete=models.SET_NULL, related_name='profiles')  # Nearest monitored station
     role = models.CharField(
         max_length=20,
         choices=[
@@ -28,6 +52,7 @@ class UserProfile(models.Model):
 
 class WeatherData(models.Model):
     location = models.CharField(max_length=100, db_index=True)  # Add index for faster queries
+    station = models.ForeignKey(Location, null=True, blank=True, on_delete=models.SET_NULL, related_name='weather_data')
     recorded_at = models.DateTimeField(db_index=True)  # Index for time-based queries
     temperature = models.FloatField()
     rainfall = models.FloatField()
@@ -37,9 +62,37 @@ class WeatherData(models.Model):
 
     class Meta:
         ordering = ['-recorded_at']  # Default ordering for recent data first
+        indexes = [
+            models.Index(fields=['station', '-recorded_at']),
+        ]
+
+class WeatherRollup(models.Model):
+    """Daily or weekly aggregate of WeatherData for one location, maintained by flood_app.rollups."""
+    GRANULARITIES = [('day', 'Daily'), ('week', 'Weekly')]
+
+    location = models.CharField(max_length=100)
+    granularity = models.CharField(max_length=10, choices=GRANULARITIES)
+    period_start = models.DateTimeField()  # UTC midnight; Monday for weekly rows
+    rain_sum = models.FloatField()
+    rain_max = models.FloatField()
+    temp_mean = models.FloatField()
+    samples = models.IntegerField()  # Hourly readings aggregated into the row
+
+    def __str__(self):
+        return f"{self.get_granularity_display()} weather at {self.location} from {self.period_start}"
+
+    class Meta:
+        ordering = ['location', 'granularity', 'period_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['location', 'granularity', 'period_start'],
+                name='unique_weather_rollup',
+            ),
+        ]
 
 class FloodPrediction(models.Model):
     location = models.CharField(max_length=100, db_index=True)
+    station = models.ForeignKey(Location, null=True, blank=True, on_delete=models.SET_NULL, related_name='predictions')
     predicted_date = models.DateTimeField(db_index=True)
     probability = models.FloatField(default=0.0)
     severity_level = models.IntegerField()
@@ -49,10 +102,15 @@ class FloodPrediction(models.Model):
 
     class Meta:
         ordering = ['predicted_date']
+        indexes = [
+            models.Index(fields=['station', 'predicted_date']),
+        ]
 
 class FloodAlert(models.Model):
     location = models.CharField(max_length=100, db_index=True)
+    station = models.ForeignKey(Location, null=True, blank=True, on_delete=models.SET_NULL, related_name='alerts')
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    predicted_date = models.DateTimeField(null=True, blank=True)  # Forecast day the alert is for
     message = models.TextField()
 
     def __str__(self):
@@ -60,10 +118,17 @@ class FloodAlert(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['station', '-created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'predicted_date'], name='unique_flood_alert'),
+        ]
 
 class RainfallData(models.Model):
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='rainfall_reports')
     location = models.CharField(max_length=100, db_index=True)
+    station = models.ForeignKey(Location, null=True, blank=True, on_delete=models.SET_NULL, related_name='rainfall_reports')
     rainfall_amount = models.FloatField()
     collected_time = models.DateTimeField(db_index=True)
     source = models.CharField(max_length=100)
@@ -83,3 +148,89 @@ class CronJobLog(models.Model):
             models.Index(fields=['code', 'created_at']),
         ]
         ordering = ['-created_at']
+
+class PipelineJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ['queued', 'running']
+
+    kind = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(default=timezone.now)  # Touched by the worker while it runs
+
+    def __str__(self):
+        return f"{self.kind} job {self.pk} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['kind', 'status']),
+        ]
+        constraints = [
+            # At most one queued or running job of each kind
+            models.UniqueConstraint(
+                fields=['kind'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_pipeline_job',
+            ),
+        ]
+
+class AlertDelivery(models.Model):
+    """Ledger of alerts delivered per forecast day, recipient and channel.
+
+    Forecasts are replaced on every prediction run, so deliveries are keyed on
+    the prediction's (location, predicted_date) rather than its primary key.
+    """
+    location = models.CharField(max_length=100)
+    predicted_date = models.DateTimeField()
+    recipient = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='alert_deliveries')
+    channel = models.CharField(max_length=20, default='sms')
+    severity_level = models.IntegerField()
+    status = models.CharField(max_length=20, choices=[('sent', 'Sent'), ('failed', 'Failed')])
+    provider_message_id = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.channel} alert to {self.recipient_id} for {self.location} on {self.predicted_date} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['location', 'predicted_date', 'recipient', 'channel'],
+                name='unique_alert_delivery',
+            ),
+        ]
+
+class ModelEvaluation(models.Model):
+    """Held-out evaluation of one trained model version."""
+    version = models.IntegerField(unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Incremental updates score each new batch just before learning it
+    # (test-then-train), so n_train and n_test count the same rows
+    prequential = models.BooleanField(default=False)
+    n_train = models.IntegerField()
+    n_test = models.IntegerField()
+    training_seconds = models.FloatField()
+    accuracy = models.FloatField()
+    brier_score = models.FloatField(null=True, blank=True)
+    confusion_matrix = models.JSONField()  # Rows: actual, columns: predicted severity 1-4
+    per_class = models.JSONField()  # {severity: {precision, recall, f1, support}}
+    calibration = models.JSONField()  # Reliability bins for the flood probability
+
+    def __str__(self):
+        return f"Evaluation of model v{self.version}"
+
+    class Meta:
+        ordering = ['-version']
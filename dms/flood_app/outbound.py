@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class CallMetrics:
+    """Thread-safe per-host counters for outbound calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hosts = defaultdict(lambda: {
+                'calls': 0, 'errors': 0, 'seconds': 0.0, 'bytes': 0, 'statuses': defaultdict(int),
+            })
+
+    def record(self, host, seconds, status=None, size=0):
+        with self._lock:
+            stats = self.hosts[host]
+            stats['calls'] += 1
+            stats['seconds'] += seconds
+            stats['bytes'] += size
+            if status is None or status >= 400:
+                stats['errors'] += 1
+            stats['statuses'][status or 'error'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                host: {**stats, 'statuses': dict(stats['statuses'])}
+                for host, stats in self.hosts.items()
+            }
+
+    def summary(self):
+        parts = []
+        for host, stats in sorted(self.snapshot().items()):
+            average_ms = stats['seconds'] / stats['calls'] * 1000
+            parts.append(
+                f"{host}: {stats['calls']} calls, {stats['errors']} errors, "
+                f"{average_ms:.0f}ms avg, {stats['bytes']} bytes"
+            )
+        return '; '.join(parts) or 'no outbound calls'
+
+
+metrics = CallMetrics()
+
+
+class PooledSession(requests.Session):
+    """Session that applies a default timeout and records call metrics."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.default_timeout
+        host = urlsplit(request.url).netloc
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.RequestException:
+            metrics.record(host, time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        if kwargs.get('stream'):
+            size = int(response.headers.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+        metrics.record(host, elapsed, response.status_code, size)
+        logger.debug("%s %s -> %s in %.0fms (%d bytes)",
+                     request.method, host, response.status_code, elapsed * 1000, size)
+        return response
+
+
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+def get_session(retries=None):
+    """Return the process-wide session used for all weather and SMS calls.
+
+    Connections are pooled and kept alive per host, calls get a default
+    timeout, idempotent requests are retried with backoff, and every call is
+    recorded in ``metrics``.
+
+    ``retries`` overrides OUTBOUND_RETRIES for callers that retry on their
+    own; ``retries=0`` gives a session that never retries, so the two layers
+    don't multiply.
+    """
+    if retries is None:
+        retries = settings.OUTBOUND_RETRIES
+    session = _sessions.get(retries)
+    if session is None:
+        with _session_lock:
+            session = _sessions.get(retries)
+            if session is None:
+                session = _sessions[retries] = build_session(retries)
+    return session
+
+
+def build_session(retries=None):
+    # Retry connection errors and transient statuses for idempotent methods
+    # only; urllib3 never retries POSTs by default, so SMS sends aren't duplicated.
+    retry = Retry(
+        total=settings.OUTBOUND_RETRIES if retries is None else retries,
+        backoff_factor=settings.OUTBOUND_BACKOFF,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.OUTBOUND_POOL_HOSTS,
+        pool_maxsize=settings.OUTBOUND_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = PooledSession(timeout=settings.OUTBOUND_TIMEOUT)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def twilio_http_client():
+    """A Twilio HTTP client that sends through the shared pooled session."""
+    client = TwilioHttpClient(timeout=settings.OUTBOUND_TIMEOUT)
+    client.session = get_session()
+    return client
@@ -1,65 +1,363 @@
 import numpy as np
+import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import confusion_matrix
+from sklearn.metrics import accuracy_score, brier_score_loss, confusion_matrix, precision_recall_fscore_support
+import copy
+import datetime
 import json
-from django.db.models import Q
-from .models import FloodPrediction  # Assume this is available in predict.py
-
-def generate_synthetic_data(n_samples=1000):
-    # Simulate data based on flood prediction context
-    np.random.seed(42)
-    locations = ['Kathmandu', 'Pokhara', 'Biratnagar', 'Nepalgunj']
-    probabilities = np.random.uniform(0, 1, n_samples)
-    severity_levels = np.array([
-        1 if p > 0.75 else 2 if p > 0.5 else 3 if p > 0.25 else 4
-        for p in probabilities
-    ])
-    return probabilities, severity_levels
-
-def train_predict_model():
-    # Generate synthetic data (replace with real data from FloodPrediction if available)
-    X, y = generate_synthetic_data()
-    
-    # Check if data is available
-    if len(X) == 0 or len(y) == 0:
-        return False
+import operator
+import time
+from functools import reduce
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from .basins import get_graph
+from .constants import FLOOD_LEVELS, SEVERITY_LEVELS
+from .features import FEATURE_COLUMNS, refresh_features, training_set
+from .locations import get_index
+from .model_store import latest_version, load_model, save_model
+from .models import FloodPrediction, ModelEvaluation
+from .training import GroupedModel, fit_models
+
+FEATURES = FEATURE_COLUMNS + ['horizon_days']
+FORECAST_DAYS = 7
+CALIBRATION_BINS = 10
+GROUPINGS = ('global', 'location', 'basin')
+
+def flood_probability(model, X, locations=None):
+    """Return (severity, P(Critical or High)) for each row of ``X``.
+
+    ``locations`` names the location of each row; grouped models need it to
+    pick the model that scores the row.
+    """
+    if isinstance(model, GroupedModel):
+        proba = model.predict_proba(X, locations)
+    else:
+        proba = model.predict_proba(X)
+    classes = model.classes_
+    severity = classes[proba.argmax(axis=1)]
+    return severity, proba[:, np.isin(classes, FLOOD_LEVELS)].sum(axis=1)
+
+def evaluate_model(model, X_test, y_test, locations=None):
+    """Confusion matrix, per-severity precision/recall and calibration on held-out rows."""
+    y_pred, probability = flood_probability(model, X_test, locations)
+    precision, recall, f1, support = precision_recall_fscore_support(
+        y_test, y_pred, labels=SEVERITY_LEVELS, zero_division=0
+    )
+    per_class = {
+        str(level): {
+            'precision': float(precision[i]),
+            'recall': float(recall[i]),
+            'f1': float(f1[i]),
+            'support': int(support[i]),
+        }
+        for i, level in enumerate(SEVERITY_LEVELS)
+    }
+
+    # Reliability of the flood probability: observed flood rate per probability bin
+    flooded = np.isin(y_test, FLOOD_LEVELS)
+    bins = np.minimum((probability * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+    calibration = []
+    for b in range(CALIBRATION_BINS):
+        in_bin = bins == b
+        if in_bin.any():
+            calibration.append({
+                'bin': [b / CALIBRATION_BINS, (b + 1) / CALIBRATION_BINS],
+                'mean_predicted': float(probability[in_bin].mean()),
+                'observed_rate': float(flooded[in_bin].mean()),
+                'count': int(in_bin.sum()),
+            })
+
+    return {
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'brier_score': float(brier_score_loss(flooded, probability)) if flooded.any() and not flooded.all() else None,
+        'confusion_matrix': confusion_matrix(y_test, y_pred, labels=SEVERITY_LEVELS).tolist(),
+        'per_class': per_class,
+        'calibration': calibration,
+    }
+
+def labelled_rows(frames, labelled_after=None):
+    """training_set rows for ``frames`` together with the location of each row."""
+    parts = {location: training_set({location: frame}, labelled_after=labelled_after)
+             for location, frame in frames.items()}
+    if not parts:
+        return np.empty((0, len(FEATURES))), np.empty(0, dtype=int), np.empty(0, dtype=str)
+    X = np.vstack([X for X, _ in parts.values()])
+    y = np.concatenate([y for _, y in parts.values()])
+    return X, y, np.repeat(list(parts), [len(y) for _, y in parts.values()])
+
+def fit_flood_model(frames, grouping='global', workers=None, min_samples=None, incremental=False):
+    """Fit the flood model on ``frames`` and evaluate it on a held-out 20%.
+
+    With ``grouping`` 'location' or 'basin', a model is also fitted for every
+    group with at least ``min_samples`` training rows and both outcomes, all
+    in parallel across ``workers`` processes; the rest use the global model.
+    ``incremental`` fits models that update_model can keep training.
+    Returns ``(model, metrics, n_train, n_test)``, or None without enough data.
+    """
+    if grouping not in GROUPINGS:
+        raise ValueError(f"Unknown model grouping {grouping!r}; expected one of {', '.join(GROUPINGS)}")
+    X, y, locations = labelled_rows(frames)
+
+    # Check if data is available (the classifier needs at least two classes)
+    if len(X) == 0 or len(np.unique(y)) < 2:
+        return None
 
     # 80/20 train-test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X.reshape(-1, 1),  # Reshape for single feature
+    X_train, X_test, y_train, y_test, loc_train, loc_test = train_test_split(
+        X,
         y,
+        locations,
         test_size=0.2,
         random_state=42
     )
 
-    # Train a simple Logistic Regression model
-    model = LogisticRegression(multi_class='multinomial', max_iter=1000)
-    model.fit(X_train, y_train)
+    datasets = {None: (X_train, y_train)}
+    groups = {}
+    if grouping != 'global':
+        if min_samples is None:
+            min_samples = settings.FLOOD_MIN_GROUP_SAMPLES
+        basins = get_graph().basin
+        groups = {location: location if grouping == 'location' else basins.get(location, '') for location in frames}
+        row_groups = np.array([groups[location] for location in loc_train])
+        for group in set(groups.values()):
+            rows = row_groups == group
+            if rows.sum() >= min_samples and len(np.unique(y_train[rows])) > 1:
+                datasets[group] = (X_train[rows], y_train[rows])
 
-    # Predict on test set
-    y_pred = model.predict(X_test)
+    fitted = fit_models(datasets, workers=workers, classes=SEVERITY_LEVELS if incremental else None)
+    model = fitted.pop(None)
+    if grouping != 'global':
+        model = GroupedModel(grouping, model, fitted, groups)
+    metrics = evaluate_model(model, X_test, y_test, loc_test)
+    return model, metrics, len(X_train), len(X_test)
 
-    # Compute confusion matrix
-    cm = confusion_matrix(y_test, y_pred, labels=[1, 2, 3, 4])  # Labels: critical, high, moderate, low
+def train_model(rebuild_features=False, parquet_root=None, grouping=None, workers=None, incremental=None):
+    """Fit the flood model on WeatherData features and store a new version.
 
-    # Convert to a list of lists for JSON serialization
-    cm_list = cm.tolist()
+    ``parquet_root`` reads the weather history from an export_parquet dataset
+    instead of the database. ``grouping``, ``workers`` and ``incremental``
+    default to FLOOD_MODEL_GROUPING, FLOOD_TRAINING_WORKERS and
+    FLOOD_INCREMENTAL; every per-group model is stored in the same versioned
+    artifact.
+    """
+    started = time.perf_counter()
+    grouping = grouping or settings.FLOOD_MODEL_GROUPING
+    if incremental is None:
+        incremental = settings.FLOOD_INCREMENTAL
+    frames = refresh_features(rebuild=rebuild_features, parquet_root=parquet_root)
+    fitted = fit_flood_model(frames, grouping, workers=workers or settings.FLOOD_TRAINING_WORKERS or None,
+                             incremental=incremental)
+    if fitted is None:
+        print("Not enough labelled weather history to train the flood model.")
+        return False
+    model, metrics, n_train, n_test = fitted
+    training_seconds = time.perf_counter() - started
+    cm_list = metrics['confusion_matrix']
+
+    version = save_evaluated_model(model, {
+        'trained_at': timezone.now().isoformat(),
+        'features': FEATURES,
+        'locations': sorted(frames),
+        'grouping': grouping,
+        'group_models': sorted(model.models) if isinstance(model, GroupedModel) else [],
+        'incremental': incremental,
+        # Every outcome observed up to here has been learned (see update_model)
+        'labelled_until': {location: frame.index[-1].isoformat() for location, frame in frames.items()},
+        'n_samples': n_train + n_test,
+        'training_seconds': training_seconds,
+        'metrics': metrics,
+    }, n_train=n_train, n_test=n_test, training_seconds=training_seconds, **metrics)
 
     # Print and return the confusion matrix
+    print(f"Trained flood model version {version} (accuracy {metrics['accuracy']:.3f})")
     print("Confusion Matrix (Rows: Actual, Columns: Predicted)")
     print("Labels: 1=Critical, 2=High, 3=Moderate, 4=Low")
-    print(cm)
+    print(np.array(cm_list))
     return {
         'success': True,
+        'version': version,
         'confusion_matrix': cm_list
     }
 
+def save_evaluated_model(model, metadata, attempts=5, **evaluation):
+    """Save ``model`` as a new version together with its ModelEvaluation row.
+
+    ModelEvaluation.version is unique across every process sharing the
+    database, so the version is allocated there rather than from the model
+    directory alone: the row is inserted first, in a short transaction, to
+    claim the number, and a process that loses the race gets an
+    IntegrityError and takes the next one. The artifact is written after the
+    claim commits, so the write lock isn't held during the disk write; the
+    row is removed again if the write fails.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                latest = ModelEvaluation.objects.aggregate(latest=Max('version'))['latest'] or 0
+                version = max(latest, latest_version() or 0) + 1
+                claim = ModelEvaluation.objects.create(version=version, **evaluation)
+            break
+        except IntegrityError:
+            if attempt == attempts:
+                raise
+    try:
+        return save_model(model, metadata, version=version)
+    except BaseException:
+        claim.delete()
+        raise
+
+def update_model(full=False):
+    """Bring the stored model up to date with newly ingested weather.
+
+    In incremental mode (FLOOD_INCREMENTAL) only the rows whose outcome became
+    known since the model's ``labelled_until`` checkpoint are read and passed
+    to partial_fit, so an update costs the same however long the history is.
+    Each batch is scored before it is learned, and the updated model is saved
+    as a new version. A full retrain runs instead when ``full`` is set, when
+    there's no incremental model yet, or once FLOOD_FULL_RETRAIN_DAYS have
+    passed since the last one, so the model can't drift indefinitely.
+    """
+    artifact = load_model()
+    metadata = artifact['metadata'] if artifact else {}
+    last_full = metadata.get('trained_at')
+    if (full or not settings.FLOOD_INCREMENTAL or not metadata.get('incremental')
+            or metadata.get('features') != FEATURES or last_full is None
+            or timezone.now() - datetime.datetime.fromisoformat(last_full)
+            >= datetime.timedelta(days=settings.FLOOD_FULL_RETRAIN_DAYS)):
+        return train_model()
+
+    started = time.perf_counter()
+    frames = refresh_features()
+    checkpoint = metadata['labelled_until']
+    # A label needs the rain up to FORECAST_DAYS after its features, so older
+    # feature rows can't have become labelled since the checkpoint.
+    context = pd.Timedelta(days=FORECAST_DAYS + 1)
+    recent = {
+        location: frame.loc[pd.Timestamp(checkpoint[location]) - context:] if location in checkpoint else frame
+        for location, frame in frames.items()
+    }
+    X, y, locations = labelled_rows(recent, labelled_after=checkpoint)
+    if len(X) == 0:
+        return {'success': True, 'version': metadata['version'], 'updated_rows': 0,
+                'confusion_matrix': metadata['metrics']['confusion_matrix']}
+
+    # Test-then-train: the batch is new to the model, so scoring it first
+    # gives an honest estimate of how the current version performs.
+    model = copy.deepcopy(artifact['model'])  # The loaded artifact may be serving forecasts
+    metrics = evaluate_model(model, X, y, locations)
+    if isinstance(model, GroupedModel):
+        model.partial_fit(X, y, locations)
+    else:
+        model.partial_fit(X, y)
+    training_seconds = time.perf_counter() - started
+
+    version = save_evaluated_model(model, {
+        **metadata,
+        'updated_at': timezone.now().isoformat(),
+        'labelled_until': {
+            **checkpoint,
+            **{location: frame.index[-1].isoformat() for location, frame in frames.items()},
+        },
+        'n_samples': metadata['n_samples'] + len(X),
+        'updates': metadata.get('updates', 0) + 1,
+        'training_seconds': training_seconds,
+        'metrics': metrics,
+    }, n_train=len(X), n_test=len(X), prequential=True, training_seconds=training_seconds, **metrics)
+    print(f"Updated flood model to version {version} with {len(X)} new rows in {training_seconds:.2f}s")
+    return {
+        'success': True,
+        'version': version,
+        'updated_rows': len(X),
+        'confusion_matrix': metrics['confusion_matrix']
+    }
+
+def get_model():
+    """Return the cached model artifact, training one first if none is stored.
+
+    An artifact trained on a different feature list can't score the current
+    features, so it is replaced the same way.
+    """
+    artifact = load_model()
+    if (artifact is None or artifact['metadata'].get('features') != FEATURES) and train_model():
+        artifact = load_model()
+    if artifact is not None and artifact['metadata'].get('features') != FEATURES:
+        return None
+    return artifact
+
+def run_predictions():
+    """Forecast every location for the next FORECAST_DAYS days in one pass.
+
+    Scores the latest feature row of every location at each horizon with a
+    single predict_proba call, then replaces each location's stored forecast
+    window with one bulk_create. Never refits an existing model.
+    """
+    timings = {}
+    started = time.perf_counter()
+    artifact = get_model()
+    if artifact is None:
+        return False
+    model, metadata = artifact['model'], artifact['metadata']
+    timings['load'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    frames = refresh_features()
+    if not frames:
+        return False
+    locations = list(frames)
+    latest = np.vstack([frames[loc][FEATURE_COLUMNS].to_numpy(dtype=float)[-1] for loc in locations])
+    horizons = np.arange(1, FORECAST_DAYS + 1)
+    X = np.column_stack([np.repeat(latest, FORECAST_DAYS, axis=0), np.tile(horizons, len(locations))])
+    timings['feature'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    severity, probability = flood_probability(model, X, np.repeat(locations, FORECAST_DAYS))
+    timings['predict'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    predictions = []
+    stations = get_index().by_name
+    for i, location in enumerate(locations):
+        issued = frames[location].index[-1].to_pydatetime()
+        day = issued.replace(hour=0, minute=0, second=0, microsecond=0)
+        for j, horizon in enumerate(horizons):
+            row = i * FORECAST_DAYS + j
+            predictions.append(FloodPrediction(
+                location=location,
+                station_id=stations.get(location),
+                predicted_date=day + datetime.timedelta(days=int(horizon)),
+                probability=float(probability[row]),
+                severity_level=int(severity[row]),
+            ))
+    # Replace each location's own window: a station whose feed is stale starts
+    # its window earlier and mustn't take other stations' past forecasts with it
+    window_starts = {}
+    for prediction in predictions:
+        first = window_starts.get(prediction.location)
+        if first is None or prediction.predicted_date < first:
+            window_starts[prediction.location] = prediction.predicted_date
+    replaced = reduce(operator.or_, (
+        Q(location=location, predicted_date__gte=first) for location, first in window_starts.items()
+    ))
+    with transaction.atomic():
+        FloodPrediction.objects.filter(replaced).delete()
+        FloodPrediction.objects.bulk_create(predictions)
+    timings['write'] = time.perf_counter() - started
+
+    return {
+        'success': True,
+        'version': metadata['version'],
+        'predictions': len(predictions),
+        'timings': timings,
+        'confusion_matrix': metadata['metrics']['confusion_matrix']
+    }
+
 # Example usage (e.g., in a view or script)
 if __name__ == "__main__":
-    result = train_predict_model()
+    result = train_model()
     if result and result.get('success'):
         cm = result['confusion_matrix']
         print("Serialized Confusion Matrix:", json.dumps(cm))
     else:
-        print("Model training failed or no data available.")
\ No newline at end of file
+        print("Model training failed or no data available.")
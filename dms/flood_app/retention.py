@@ -0,0 +1,125 @@
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import CronJobLog, RainfallData, WeatherData, WeatherRollup
+
+logger = logging.getLogger(__name__)
+
+VACUUM_LOG_CODE = 'flood_app.vacuum'
+
+# Tables pruned by age: (label, model, timestamp field, retention setting)
+RETENTION_POLICIES = [
+    ('weather', WeatherData, 'recorded_at', 'RETENTION_RAW_DAYS'),
+    ('rainfall', RainfallData, 'collected_time', 'RETENTION_REPORT_DAYS'),
+    ('rollups', WeatherRollup, 'period_start', 'RETENTION_ROLLUP_DAYS'),
+]
+
+
+def delete_in_chunks(queryset, chunk_size=None, pause=None):
+    """Delete the rows of ``queryset`` in primary-key batches.
+
+    Each batch is its own short transaction followed by ``pause`` seconds of
+    sleep, so other writers get the database between batches instead of
+    waiting behind one long delete. Returns the number of rows deleted.
+    """
+    chunk_size = chunk_size or settings.RETENTION_DELETE_CHUNK
+    pause = settings.RETENTION_DELETE_PAUSE if pause is None else pause
+    model = queryset.model
+    pks = queryset.order_by().values_list('pk', flat=True)
+    deleted = 0
+    while True:
+        batch = list(pks[:chunk_size])
+        if not batch:
+            return deleted
+        with transaction.atomic():
+            deleted += model.objects.filter(pk__in=batch).delete()[0]
+        if len(batch) < chunk_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def prune_history(now=None, chunk_size=None, pause=None):
+    """Delete raw readings and rollups older than their retention period.
+
+    Raw WeatherData is kept for RETENTION_RAW_DAYS, the rollups for
+    RETENTION_ROLLUP_DAYS and citizen RainfallData reports for
+    RETENTION_REPORT_DAYS; a setting of 0 keeps everything.
+    Returns ``{label: rows deleted}``.
+    """
+    now = now or timezone.now()
+    deleted = {}
+    for label, model, field, setting in RETENTION_POLICIES:
+        days = getattr(settings, setting)
+        if not days:
+            continue
+        cutoff = now - datetime.timedelta(days=days)
+        deleted[label] = delete_in_chunks(
+            model.objects.filter(**{f'{field}__lt': cutoff}), chunk_size, pause,
+        )
+    return deleted
+
+
+def database_size():
+    """Size of the database in bytes, or None where the backend doesn't report it."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA page_count')
+            pages = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            return pages * cursor.fetchone()[0]
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_database_size(current_database())')
+            return cursor.fetchone()[0]
+    return None
+
+
+def compact_database(vacuum=True):
+    """Refresh planner statistics and, with ``vacuum``, return free pages to the OS.
+
+    Must run outside a transaction. Returns the database size before and
+    after and the bytes reclaimed (None where the backend can't tell).
+    """
+    tables = [model._meta.db_table for _, model, _, _ in RETENTION_POLICIES]
+    before = database_size()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            if vacuum:
+                cursor.execute('VACUUM')
+            cursor.execute('ANALYZE')
+        elif connection.vendor == 'postgresql':
+            statement = 'VACUUM ANALYZE' if vacuum else 'ANALYZE'
+            for table in tables:
+                cursor.execute(f'{statement} {connection.ops.quote_name(table)}')
+    after = database_size()
+    reclaimed = before - after if before is not None and after is not None else None
+    return {'size_before': before, 'size_after': after, 'reclaimed': reclaimed}
+
+
+def vacuum_due(now=None):
+    """Whether the last VACUUM was more than RETENTION_VACUUM_DAYS ago."""
+    last = CronJobLog.objects.filter(code=VACUUM_LOG_CODE).values_list('created_at', flat=True).first()
+    now = now or timezone.now()
+    return last is None or now - last >= datetime.timedelta(days=settings.RETENTION_VACUUM_DAYS)
+
+
+def run_retention(vacuum=None):
+    """Prune old history, then compact the database.
+
+    ``vacuum`` forces (True) or skips (False) the VACUUM; by default it runs
+    once every RETENTION_VACUUM_DAYS and ANALYZE runs every time. Returns the
+    rows deleted per table together with the compaction report.
+    """
+    deleted = prune_history()
+    if vacuum is None:
+        vacuum = vacuum_due()
+    report = compact_database(vacuum=vacuum)
+    if vacuum:
+        CronJobLog.objects.create(code=VACUUM_LOG_CODE)
+    logger.info("Retention: deleted %s, vacuum=%s, reclaimed %s bytes", deleted, vacuum, report['reclaimed'])
+    return {'deleted': deleted, 'vacuumed': vacuum, **report}
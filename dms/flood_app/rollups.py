@@ -0,0 +1,191 @@
+import datetime
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncWeek
+
+from .ingest import as_utc
+from .models import WeatherData, WeatherRollup
+
+# Query resolutions from finest to coarsest. 'hour' is the raw WeatherData.
+RESOLUTIONS = ['hour', 'day', 'week']
+ROLLUP_FIELDS = ['rain_sum', 'rain_max', 'temp_mean', 'samples']
+
+PERIOD_LENGTH = {
+    'hour': datetime.timedelta(hours=1),
+    'day': datetime.timedelta(days=1),
+    'week': datetime.timedelta(weeks=1),
+}
+
+# Spans up to these lengths are answered at the given resolution when the
+# caller doesn't ask for one, keeping charts to a few hundred points.
+AUTO_RESOLUTION = [
+    (datetime.timedelta(days=14), 'hour'),
+    (datetime.timedelta(days=400), 'day'),
+]
+
+
+def floor_period(value, resolution):
+    """Start of the UTC hour, day or (Monday-based) week containing ``value``."""
+    value = as_utc(value).astimezone(datetime.timezone.utc)
+    if resolution == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return day
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def _upsert(location, granularity, rows):
+    WeatherRollup.objects.bulk_create(
+        [WeatherRollup(location=location, granularity=granularity, **row) for row in rows],
+        update_conflicts=True,
+        unique_fields=['location', 'granularity', 'period_start'],
+        update_fields=ROLLUP_FIELDS,
+    )
+
+
+def refresh_rollups(location, since=None):
+    """Recompute the daily and weekly rollups of ``location`` from ``since`` on.
+
+    Only the days from ``since`` and the weeks touching them are rebuilt:
+    daily rows are aggregated from the raw hourly readings and weekly rows
+    from the daily ones. Without ``since`` the whole history is rebuilt. Returns the
+    number of ``(daily, weekly)`` rows written.
+    """
+    raw = WeatherData.objects.filter(location=location).order_by()
+    days = WeatherRollup.objects.filter(location=location, granularity='day').order_by()
+    if since is not None:
+        raw = raw.filter(recorded_at__gte=floor_period(since, 'day'))
+        days = days.filter(period_start__gte=floor_period(since, 'week'))
+
+    with transaction.atomic():
+        daily = list(
+            raw.annotate(period_start=TruncDay('recorded_at', tzinfo=datetime.timezone.utc))
+            .values('period_start')
+            .annotate(
+                rain_sum=Sum('rainfall'), rain_max=Max('rainfall'),
+                temp_mean=Avg('temperature'), samples=Count('id'),
+            )
+        )
+        _upsert(location, 'day', daily)
+
+        # Weekly means are weighted by the number of readings behind each day
+        weekly = []
+        for row in (
+            days.annotate(week=TruncWeek('period_start', tzinfo=datetime.timezone.utc))
+            .values('week')
+            .annotate(
+                rain_sum_=Sum('rain_sum'), rain_max_=Max('rain_max'),
+                temp_total=Sum(F('temp_mean') * F('samples')), samples_=Sum('samples'),
+            )
+        ):
+            weekly.append({
+                'period_start': row['week'],
+                'rain_sum': row['rain_sum_'],
+                'rain_max': row['rain_max_'],
+                'temp_mean': row['temp_total'] / row['samples_'],
+                'samples': row['samples_'],
+            })
+        _upsert(location, 'week', weekly)
+    return len(daily), len(weekly)
+
+
+def rebuild_rollups(locations=None):
+    """Rebuild the rollups of ``locations`` (default: every location with data).
+
+    Rollups outlive the raw readings (RETENTION_ROLLUP_DAYS vs
+    RETENTION_RAW_DAYS), so only the days the remaining raw history fully
+    covers are dropped and rebuilt; older rollups are kept as they are.
+    """
+    if locations is None:
+        locations = WeatherData.objects.order_by().values_list('location', flat=True).distinct()
+    written = {}
+    for location in locations:
+        earliest = WeatherData.objects.filter(location=location).aggregate(earliest=Min('recorded_at'))['earliest']
+        if earliest is None:
+            written[location] = (0, 0)
+            continue
+        rollups = WeatherRollup.objects.filter(location=location)
+        start = floor_period(earliest, 'day')
+        if rollups.filter(granularity='day', period_start__lt=start).exists():
+            # The history was pruned, so the first raw day may be partial
+            start = ceil_period(earliest, 'day')
+        with transaction.atomic():
+            rollups.filter(granularity='day', period_start__gte=start).delete()
+            rollups.filter(granularity='week', period_start__gte=floor_period(start, 'week')).delete()
+            written[location] = refresh_rollups(location, since=start)
+    return written
+
+
+def ceil_period(value, resolution):
+    """Start of the first hour, day or week beginning at or after ``value``."""
+    floor = floor_period(value, resolution)
+    if floor == as_utc(value):
+        return floor
+    return floor + PERIOD_LENGTH[resolution]
+
+
+def _raw_rows(location, start, end):
+    readings = WeatherData.objects.filter(
+        location=location, recorded_at__gte=start, recorded_at__lt=end,
+    ).order_by('recorded_at').values_list('recorded_at', 'rainfall', 'temperature')
+    for recorded_at, rainfall, temperature in readings:
+        yield {'period_start': recorded_at, 'rain_sum': rainfall, 'rain_max': rainfall,
+               'temp_mean': temperature, 'samples': 1}
+
+
+def _rows(location, start, end, coarsest):
+    """Rows covering [start, end), read from the coarsest table that fits.
+
+    Whole periods in the middle of the range come from the ``coarsest``
+    rollup; the partial periods at either end fall through to finer tables.
+    """
+    if start >= end:
+        return iter(())
+    for level in range(RESOLUTIONS.index(coarsest), 0, -1):
+        granularity = RESOLUTIONS[level]
+        inner_start, inner_end = ceil_period(start, granularity), floor_period(end, granularity)
+        if inner_start < inner_end:
+            finer = RESOLUTIONS[level - 1]
+            return chain(
+                _rows(location, start, inner_start, finer),
+                WeatherRollup.objects.filter(
+                    location=location, granularity=granularity,
+                    period_start__gte=inner_start, period_start__lt=inner_end,
+                ).order_by('period_start').values('period_start', *ROLLUP_FIELDS).iterator(),
+                _rows(location, inner_end, end, finer),
+            )
+    return _raw_rows(location, start, end)
+
+
+def weather_series(location, start, end, resolution=None):
+    """Rainfall and temperature of ``location`` over [start, end) in ``resolution`` buckets.
+
+    ``resolution`` is 'hour', 'day' or 'week'; by default it is picked from
+    the length of the span. Whole periods are read from the coarsest rollup
+    that fits and only the partial periods at the edges from finer tables, so
+    a season of daily points reads a few hundred rows rather than every
+    hourly reading. Returns a list of dicts with ``period_start``,
+    ``rain_sum``, ``rain_max``, ``temp_mean`` and ``samples``.
+    """
+    start, end = as_utc(start), as_utc(end)
+    if resolution is None:
+        resolution = next((r for span, r in AUTO_RESOLUTION if end - start <= span), 'week')
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+
+    series = {}
+    for row in _rows(location, start, end, resolution):
+        period = floor_period(row['period_start'], resolution)
+        bucket = series.get(period)
+        if bucket is None:
+            series[period] = {**row, 'period_start': period}
+            continue
+        samples = bucket['samples'] + row['samples']
+        bucket['temp_mean'] = (bucket['temp_mean'] * bucket['samples'] + row['temp_mean'] * row['samples']) / samples
+        bucket['rain_sum'] += row['rain_sum']
+        bucket['rain_max'] = max(bucket['rain_max'], row['rain_max'])
+        bucket['samples'] = samples
+    return list(series.values())
@@ -1,26 +1,245 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from twilio.rest import Client
-from decouple import config
-from flood_app.models import FloodPrediction, UserProfile
-import datetime
+from flood_app.outbound import twilio_http_client
+from flood_app.models import AlertDelivery, FloodAlert, FloodPrediction, UserProfile
+import logging
+import random
+import threading
+import time
 
-def send_flood_alerts():
-    account_sid = config('TWILIO_ACCOUNT_SID')
-    auth_token = config('TWILIO_AUTH_TOKEN')
-    twilio_phone = config('TWILIO_PHONE_NUMBER')
-    client = Client(account_sid, auth_token)
+logger = logging.getLogger(__name__)
 
-    predictions = FloodPrediction.objects.filter(predicted_date__gte=datetime.datetime.now())
+CHANNEL = 'sms'
+# Deliveries are written to the ledger in batches of this many results, or
+# sooner once this many seconds have passed, so a crash mid fan-out only
+# re-sends the last few messages.
+LEDGER_BATCH_SIZE = 50
+LEDGER_FLUSH_SECONDS = 2.0
+
+
+@dataclass
+class AlertMessage:
+    location: str
+    predicted_date: object
+    severity_level: int
+    recipient_id: int
+    phone: str
+    body: str
+    station_id: int = None
+
+    @property
+    def ledger_key(self):
+        return (self.location, self.predicted_date, self.recipient_id)
+
+
+@dataclass
+class DeliveryResult:
+    message: AlertMessage
+    status: str  # 'sent' or 'failed'
+    provider_message_id: str = ''
+    error: str = ''
+
+
+class TwilioProvider:
+    """Sends SMS through Twilio using the credentials from settings."""
+
+    def __init__(self):
+        self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN,
+                             http_client=twilio_http_client())
+        self.from_phone = settings.TWILIO_PHONE_NUMBER
+
+    def send(self, to, body):
+        return self.client.messages.create(body=body, from_=self.from_phone, to=to).sid
+
+
+class FakeProvider:
+    """Offline provider that records messages instead of sending them.
+
+    ``latency`` simulates the provider round-trip in seconds and
+    ``failure_rate`` the fraction of sends that raise.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to, body):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError("Simulated provider failure")
+        with self._lock:
+            self.sent.append((to, body))
+            return f"fake-{len(self.sent)}"
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` acquisitions per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AlertDispatcher:
+    """Sends alert messages on a bounded thread pool under a shared rate limit."""
+
+    def __init__(self, provider=None, rate=None, burst=None, workers=None):
+        self.provider = provider or import_string(settings.ALERT_SMS_PROVIDER)()
+        self.bucket = TokenBucket(rate or settings.ALERT_SMS_RATE, burst or settings.ALERT_SMS_BURST)
+        self.workers = workers or settings.ALERT_SMS_WORKERS
+
+    def _send(self, message):
+        self.bucket.acquire()
+        try:
+            message_id = self.provider.send(message.phone, message.body)
+            return DeliveryResult(message, 'sent', provider_message_id=str(message_id or ''))
+        except Exception as e:
+            logger.warning("Failed to send alert to %s: %s", message.phone, e)
+            return DeliveryResult(message, 'failed', error=str(e))
+
+    def dispatch(self, messages):
+        """Send every message and return one DeliveryResult per message, in order."""
+        if not messages:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(messages))) as executor:
+            return list(executor.map(self._send, messages))
+
+    def completed(self, messages):
+        """Send every message, yielding each DeliveryResult as soon as it finishes."""
+        if not messages:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(messages))) as executor:
+            for future in as_completed([executor.submit(self._send, message) for message in messages]):
+                yield future.result()
+
+
+def recipients_by_station(station_ids):
+    """Resolve active recipients for ``station_ids`` with a single joined query."""
+    recipients = defaultdict(list)
+    profiles = (
+        UserProfile.objects.filter(station_id__in=station_ids, user__is_active=True)
+        .exclude(phone='')
+        .values_list('station_id', 'id', 'phone')
+    )
+    for station_id, profile_id, phone in profiles:
+        recipients[station_id].append((profile_id, phone))
+    return recipients
+
+
+def build_alert_messages(predictions):
+    recipients = recipients_by_station({pred.station_id for pred in predictions if pred.station_id})
+    messages = []
     for pred in predictions:
-        if pred.probability > 0.7:
-            users = UserProfile.objects.filter(location=pred.location, is_active=True)
-            for user in users:
-                message = f"ALERT: Flood risk in {pred.location} on {pred.predicted_date.date()}! Severity: {pred.severity_level}/5. Take precautions."
-                try:
-                    client.messages.create(
-                        body=message,
-                        from_=twilio_phone,
-                        to=f"+977{user.phone}"
-                    )
-                    print(f"Alert sent to {user.name} at {user.phone}")
-                except Exception as e:
-                    print(f"Failed to send alert to {user.phone}: {e}")
\ No newline at end of file
+        for profile_id, phone in recipients.get(pred.station_id, []):
+            body = f"ALERT: Flood risk in {pred.location} on {pred.predicted_date.date()}! Severity: {pred.severity_level}/5. Take precautions."
+            messages.append(AlertMessage(pred.location, pred.predicted_date, pred.severity_level,
+                                         profile_id, f"+977{phone}", body, pred.station_id))
+    return messages
+
+
+def undelivered(messages, channel=CHANNEL):
+    """Drop messages the ledger already records as sent, using one query."""
+    if not messages:
+        return []
+    delivered = set(AlertDelivery.objects.filter(
+        channel=channel,
+        status='sent',
+        location__in={m.location for m in messages},
+        predicted_date__in={m.predicted_date for m in messages},
+    ).values_list('location', 'predicted_date', 'recipient_id'))
+    return [m for m in messages if m.ledger_key not in delivered]
+
+
+def record_deliveries(results, channel=CHANNEL):
+    """Write the ledger and the matching FloodAlert rows in bulk.
+
+    Failed deliveries are recorded too and retried on the next run; one
+    FloodAlert is created per forecast day that reached at least one
+    recipient, and later batches or runs reaching more recipients add none.
+    """
+    deliveries = [
+        AlertDelivery(
+            location=r.message.location,
+            predicted_date=r.message.predicted_date,
+            recipient_id=r.message.recipient_id,
+            channel=channel,
+            severity_level=r.message.severity_level,
+            status=r.status,
+            provider_message_id=r.provider_message_id,
+            error=r.error,
+        )
+        for r in results
+    ]
+    alerts = {}
+    for r in results:
+        if r.status == 'sent':
+            key = (r.message.location, r.message.predicted_date)
+            alerts.setdefault(key, FloodAlert(location=r.message.location, station_id=r.message.station_id,
+                                              predicted_date=r.message.predicted_date, message=r.message.body))
+    with transaction.atomic():
+        AlertDelivery.objects.bulk_create(
+            deliveries,
+            update_conflicts=True,
+            unique_fields=['location', 'predicted_date', 'recipient', 'channel'],
+            update_fields=['severity_level', 'status', 'provider_message_id', 'error'],
+        )
+        FloodAlert.objects.bulk_create(alerts.values(), ignore_conflicts=True)
+
+
+def send_flood_alerts(dispatcher=None):
+    """Alert every recipient of each upcoming high-probability prediction.
+
+    Recipients already alerted for a forecast day are skipped, so re-runs only
+    send what is new. Results are written to the ledger as the sends finish
+    rather than after the whole fan-out, which at ALERT_SMS_RATE can take
+    many minutes. Returns the number of messages sent, failed and skipped.
+    """
+    predictions = list(FloodPrediction.objects.filter(
+        predicted_date__gte=timezone.now(),
+        probability__gt=settings.ALERT_PROBABILITY_THRESHOLD,
+    ))
+    candidates = build_alert_messages(predictions)
+    messages = undelivered(candidates)
+    skipped = len(candidates) - len(messages)
+    if not messages:
+        return {'sent': 0, 'failed': 0, 'skipped': skipped}
+
+    sent = failed = 0
+    batch, flushed = [], time.monotonic()
+    for result in (dispatcher or AlertDispatcher()).completed(messages):
+        batch.append(result)
+        if result.status == 'sent':
+            sent += 1
+        else:
+            failed += 1
+        if len(batch) >= LEDGER_BATCH_SIZE or time.monotonic() - flushed >= LEDGER_FLUSH_SECONDS:
+            record_deliveries(batch)
+            batch, flushed = [], time.monotonic()
+    if batch:
+        record_deliveries(batch)
+    logger.info("Flood alerts: %d sent, %d failed, %d already delivered", sent, failed, skipped)
+    return {'sent': sent, 'failed': failed, 'skipped': skipped}
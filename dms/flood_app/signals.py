@@ -1,9 +1,54 @@
-from django.db.models.signals import post_save
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import UserProfile
+from . import basins, locations, stations
+from .features import mark_stale
+from .models import FloodAlert, FloodPrediction, Location, RainfallData, UserProfile, WeatherData
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply settings.SQLITE_PRAGMAS to each new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+@receiver(pre_save, sender=UserProfile)
+def assign_profile_station(sender, instance, update_fields=None, **kwargs):
+    stations.assign_station(instance, update_fields)
+
+@receiver(post_init, sender=UserProfile)
+@receiver(post_save, sender=UserProfile)
+def remember_profile_location(sender, instance, update_fields=None, **kwargs):
+    stations.remember_location(instance, update_fields)
+
+@receiver(pre_save, sender=WeatherData)
+@receiver(pre_save, sender=RainfallData)
+@receiver(pre_save, sender=FloodPrediction)
+@receiver(pre_save, sender=FloodAlert)
+def assign_station(sender, instance, **kwargs):
+    """Fill ``station`` from the location text; bulk writers set it themselves."""
+    if instance.station_id is None and instance.location:
+        instance.station_id = locations.resolve_location(instance.location)
+
+@receiver(post_save, sender=RainfallData)
+@receiver(post_delete, sender=RainfallData)
+def mark_report_features_stale(sender, instance, **kwargs):
+    """Reports can be filed for past hours; their cached features must be recomputed."""
+    if instance.location and instance.collected_time:
+        mark_stale(instance.location, instance.collected_time)
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_location_index(sender, **kwargs):
+    basins.invalidate()
+    locations.invalidate()
+    stations.invalidate()
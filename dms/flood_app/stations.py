@@ -0,0 +1,188 @@
+import csv
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.db import transaction
+from scipy.spatial import cKDTree
+
+from .locations import LocationIndex, resolve_location
+from .models import Location, UserProfile
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer.csv'
+ASSIGN_CHUNK_SIZE = 5000
+# Profile fields a station is derived from
+LOCATION_FIELDS = ('location', 'latitude', 'longitude')
+
+
+@lru_cache(maxsize=1)
+def gazetteer():
+    """Bundled place names with coordinates, as ``(LocationIndex, [(lat, lon)])``."""
+    rows, coordinates = [], []
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            aliases = [alias for alias in row['aliases'].split(';') if alias]
+            rows.append((i, row['name'], row['name'], aliases))
+            coordinates.append((float(row['latitude']), float(row['longitude'])))
+    return LocationIndex(rows), coordinates
+
+
+def geocode(text):
+    """Offline ``(latitude, longitude)`` for a place name, or None.
+
+    Looks the text up in the bundled gazetteer, then among the monitored
+    stations; "Lalitpur, Nepal" and "Lalitpur (Patan)" are tried as "Lalitpur".
+    """
+    if not text:
+        return None
+    index, coordinates = gazetteer()
+    for candidate in (text, text.split(',')[0], text.split('(')[0]):
+        place = index.resolve(candidate)
+        if place is not None:
+            return coordinates[place]
+    station = resolve_location(text)
+    if station is not None:
+        return tuple(Location.objects.filter(pk=station).values_list('latitude', 'longitude').get())
+    return None
+
+
+def _unit_vectors(latitudes, longitudes):
+    # Points on the unit sphere, so straight-line nearest is great-circle nearest
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+class StationTree:
+    """KD-tree over the monitored stations' coordinates."""
+
+    def __init__(self, rows):
+        # rows: (id, latitude, longitude)
+        self.ids = np.array([row[0] for row in rows])
+        self.tree = cKDTree(_unit_vectors([row[1] for row in rows], [row[2] for row in rows])) if rows else None
+
+    def nearest(self, latitudes, longitudes):
+        """Nearest station id for each coordinate pair."""
+        if self.tree is None or not len(latitudes):
+            return np.full(len(latitudes), None)
+        _, positions = self.tree.query(_unit_vectors(latitudes, longitudes))
+        return self.ids[positions]
+
+
+_tree = None
+_lock = threading.Lock()
+
+
+def get_tree():
+    global _tree
+    if _tree is None:
+        with _lock:
+            if _tree is None:
+                _tree = StationTree(list(Location.objects.values_list('id', 'latitude', 'longitude')))
+    return _tree
+
+
+def invalidate():
+    global _tree
+    _tree = None
+
+
+def nearest_station(latitude, longitude):
+    """Id of the nearest station, or None while there are no stations."""
+    station = get_tree().nearest([latitude], [longitude])[0]
+    return None if station is None else int(station)
+
+
+def remember_location(profile, update_fields=None):
+    """Note ``profile``'s location fields as loaded or last saved, for assign_station."""
+    saved = getattr(profile, '_saved_location', None)
+    values = []
+    for i, field in enumerate(LOCATION_FIELDS):
+        if update_fields is not None and field not in update_fields and saved is not None:
+            values.append(saved[i])  # Not written by this save
+        elif field in profile.__dict__:
+            values.append(profile.__dict__[field])
+        else:
+            profile.__dict__.pop('_saved_location', None)  # Deferred, so unknown
+            return
+    profile._saved_location = tuple(values)
+
+
+def assign_station(profile, update_fields=None):
+    """Geocode ``profile`` and store its nearest monitored station.
+
+    Runs only when the profile is new, its location text changed or it has no
+    station yet; explicitly set coordinates are kept. Doesn't save.
+
+    The previous values come from remember_location, so a save doesn't cost
+    an extra SELECT; saves whose ``update_fields`` leave the location alone
+    are skipped.
+    """
+    if update_fields is not None and not {*LOCATION_FIELDS, 'station'} & set(update_fields):
+        return
+    previous = None
+    if profile.pk:
+        # Instances built by hand with a primary key still read the stored values
+        previous = None if profile._state.adding else getattr(profile, '_saved_location', None)
+        if previous is None:
+            previous = UserProfile.objects.filter(pk=profile.pk).values_list(*LOCATION_FIELDS).first()
+    location_changed = previous is None or previous[0] != profile.location
+    coordinates_changed = previous is not None and previous[1:] != (profile.latitude, profile.longitude)
+    if not (location_changed or coordinates_changed or profile.station_id is None):
+        return
+
+    if location_changed and not coordinates_changed:
+        profile.latitude, profile.longitude = geocode(profile.location) or (None, None)
+    if profile.latitude is not None and profile.longitude is not None:
+        profile.station_id = nearest_station(profile.latitude, profile.longitude)
+    else:
+        profile.station_id = resolve_location(profile.location)
+
+
+def assign_stations(reassign=False, chunk_size=ASSIGN_CHUNK_SIZE):
+    """Geocode and assign the nearest station to profiles in bulk.
+
+    Each distinct location string is geocoded and matched to a station once,
+    and profiles sharing a result are written with a single UPDATE per chunk.
+    Only profiles without a station are processed unless ``reassign`` is set.
+    Returns ``(assigned, unresolved)``.
+    """
+    profiles = UserProfile.objects.order_by('pk')
+    if not reassign:
+        profiles = profiles.filter(station__isnull=True)
+    tree = get_tree()
+    by_location = {}  # location text -> (latitude, longitude, station_id)
+    assigned = unresolved = 0
+    last_pk = 0
+    while True:
+        chunk = list(profiles.filter(pk__gt=last_pk).values_list('pk', 'location', 'latitude', 'longitude')[:chunk_size])
+        if not chunk:
+            return assigned, unresolved
+        last_pk = chunk[-1][0]
+
+        geocoded = defaultdict(list)  # (latitude, longitude, station_id) -> pks
+        explicit = []  # Profiles with their own coordinates keep them
+        for pk, location, latitude, longitude in chunk:
+            if latitude is not None and longitude is not None:
+                explicit.append((pk, latitude, longitude))
+                continue
+            if location not in by_location:
+                coordinates = geocode(location)
+                by_location[location] = (*coordinates, nearest_station(*coordinates)) if coordinates else (None, None, None)
+            geocoded[by_location[location]].append(pk)
+
+        by_station = defaultdict(list)
+        if explicit:
+            nearest = tree.nearest([p[1] for p in explicit], [p[2] for p in explicit])
+            for (pk, _, _), station in zip(explicit, nearest):
+                by_station[None if station is None else int(station)].append(pk)
+
+        with transaction.atomic():
+            for (latitude, longitude, station), pks in geocoded.items():
+                UserProfile.objects.filter(pk__in=pks).update(latitude=latitude, longitude=longitude, station_id=station)
+            for station, pks in by_station.items():
+                UserProfile.objects.filter(pk__in=pks).update(station_id=station)
+        unresolved += len(geocoded.get((None, None, None), []))
+        assigned += len(chunk) - len(geocoded.get((None, None, None), []))
@@ -1,3 +1,762 @@
-from django.test import TestCase
+"""Tests for flood_app; they must pass on every supported database backend.
 
-# Create your tests here.
+The suite runs against whatever DB_ENGINE selects, so run it once per
+backend to check parity, e.g. against a local Postgres container:
+
+    docker run -d -p 5432:5432 -e POSTGRES_USER=dms -e POSTGRES_PASSWORD=dms postgres:16
+    DB_ENGINE=postgresql DB_PASSWORD=dms python manage.py test flood_app
+    python manage.py test flood_app
+"""
+import datetime
+import gzip
+import io
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import send_alerts
+from .basins import BasinGraph, basin_risk
+from .columnar import export_table
+from .features import add_upstream_features, refresh_features
+from .ingest import WeatherColumns, upsert_weather_columns
+from .jobs import JOB_STEPS, _expire_stale_jobs, _run_steps
+from .management.commands import collect_weather_data
+from .locations import LocationIndex, resolve_location
+from .models import (
+    AlertDelivery, CronJobLog, FloodAlert, FloodPrediction, Location, ModelEvaluation, PipelineJob, RainfallData, UserProfile,
+    WeatherData, WeatherRollup,
+)
+from .model_store import load_model
+from .outbound import get_session
+from .predict import FORECAST_DAYS, labelled_rows, run_predictions, train_model, update_model
+from .retention import delete_in_chunks, prune_history
+from .rollups import rebuild_rollups, refresh_rollups, weather_series
+from .send_alerts import AlertDispatcher, AlertMessage, FakeProvider, send_flood_alerts
+from .signals import invalidate_location_index
+from .stations import StationTree, assign_stations, geocode, nearest_station
+from .training import GroupedModel
+from .weather_cache import get_live_weather
+
+UTC = datetime.timezone.utc
+START = datetime.datetime(2026, 6, 1, tzinfo=UTC)  # A Monday
+LOCATIONS = ['Kathmandu (Bagmati River)', 'Pokhara (Seti River, tributary of Gandaki)']
+
+
+def hourly_columns(hours, seed=0, start=START):
+    """Deterministic readings with dry spells and a few heavy-rain days."""
+    rng = np.random.default_rng(seed)
+    rain = rng.gamma(0.3, 2.0, hours) * (rng.random(hours) < 0.3)
+    rain[rng.random(hours) < 0.02] += 12.0
+    return WeatherColumns(
+        recorded_at=[start + datetime.timedelta(hours=i) for i in range(hours)],
+        temperature=rng.normal(22, 4, hours).round(2).tolist(),
+        rainfall=rain.round(2).tolist(),
+    )
+
+
+class IngestionTests(TestCase):
+    def test_upsert_creates_then_updates_changed_rows(self):
+        columns = hourly_columns(48)
+        self.assertEqual(upsert_weather_columns(LOCATIONS[0], columns), (48, 0))
+        self.assertEqual(upsert_weather_columns(LOCATIONS[0], columns), (0, 0))
+
+        changed = WeatherColumns(columns.recorded_at[:5], [30.0] * 5, columns.rainfall[:5])
+        self.assertEqual(upsert_weather_columns(LOCATIONS[0], changed), (0, 5))
+        self.assertEqual(WeatherData.objects.count(), 48)
+        self.assertEqual(WeatherData.objects.filter(temperature=30.0).count(), 5)
+
+    def test_rollups_match_raw_aggregates(self):
+        columns = hourly_columns(24 * 21)
+        upsert_weather_columns(LOCATIONS[0], columns)
+        self.assertEqual(refresh_rollups(LOCATIONS[0]), (21, 3))
+
+        day = WeatherRollup.objects.get(location=LOCATIONS[0], granularity='day', period_start=START)
+        self.assertAlmostEqual(day.rain_sum, sum(columns.rainfall[:24]))
+        self.assertAlmostEqual(day.rain_max, max(columns.rainfall[:24]))
+        self.assertAlmostEqual(day.temp_mean, np.mean(columns.temperature[:24]))
+        week = WeatherRollup.objects.get(location=LOCATIONS[0], granularity='week', period_start=START)
+        self.assertEqual(week.samples, 24 * 7)
+        self.assertAlmostEqual(week.rain_sum, sum(columns.rainfall[:24 * 7]))
+        self.assertAlmostEqual(week.temp_mean, np.mean(columns.temperature[:24 * 7]))
+
+    def test_incremental_rollups_equal_rebuild(self):
+        columns = hourly_columns(24 * 14)
+        upsert_weather_columns(LOCATIONS[0], WeatherColumns(
+            columns.recorded_at[:200], columns.temperature[:200], columns.rainfall[:200]))
+        refresh_rollups(LOCATIONS[0])
+        upsert_weather_columns(LOCATIONS[0], columns)
+        refresh_rollups(LOCATIONS[0], since=columns.recorded_at[200])
+        fields = ['granularity', 'period_start', 'rain_sum', 'rain_max', 'temp_mean', 'samples']
+        incremental = list(WeatherRollup.objects.values_list(*fields))
+
+        WeatherRollup.objects.all().delete()
+        refresh_rollups(LOCATIONS[0])
+        rebuilt = list(WeatherRollup.objects.values_list(*fields))
+        self.assertEqual(len(incremental), len(rebuilt))
+        for got, expected in zip(incremental, rebuilt):
+            self.assertEqual(got[:2], expected[:2])
+            np.testing.assert_allclose(got[2:], expected[2:])
+
+    def test_weather_series_reads_partial_periods_from_raw(self):
+        columns = hourly_columns(24 * 14)
+        upsert_weather_columns(LOCATIONS[0], columns)
+        refresh_rollups(LOCATIONS[0])
+        start, end = START + datetime.timedelta(hours=5), START + datetime.timedelta(days=10, hours=3)
+
+        series = weather_series(LOCATIONS[0], start, end, 'week')
+        self.assertEqual([row['period_start'] for row in series], [START, START + datetime.timedelta(days=7)])
+        self.assertAlmostEqual(sum(row['rain_sum'] for row in series), sum(columns.rainfall[5:24 * 10 + 3]))
+        self.assertEqual(sum(row['samples'] for row in series), 24 * 10 + 3 - 5)
+
+    def test_rebuild_keeps_rollups_older_than_raw(self):
+        upsert_weather_columns(LOCATIONS[0], hourly_columns(24 * 21))
+        refresh_rollups(LOCATIONS[0])
+        fields = ['granularity', 'period_start', 'rain_sum', 'rain_max', 'temp_mean', 'samples']
+        before = list(WeatherRollup.objects.order_by('granularity', 'period_start').values_list(*fields))
+
+        # Raw readings pruned part way through day 10, while the rollups are kept
+        WeatherData.objects.filter(recorded_at__lt=START + datetime.timedelta(days=10, hours=5)).delete()
+        rebuild_rollups()
+        after = list(WeatherRollup.objects.order_by('granularity', 'period_start').values_list(*fields))
+        self.assertEqual(len(after), len(before))
+        for got, expected in zip(after, before):
+            self.assertEqual(got[:2], expected[:2])
+            np.testing.assert_allclose(got[2:], expected[2:])
+
+    def test_prune_job_is_scheduled(self):
+        self.assertIn('flood_app.cron.PruneHistoryCronJob', settings.CRON_CLASSES)
+        with mock.patch('flood_app.cron.run_retention') as run_retention, \
+                self.settings(CRON_CLASSES=['flood_app.cron.PruneHistoryCronJob']):
+            call_command('run_cron_jobs', stdout=io.StringIO())
+            call_command('run_cron_jobs', stdout=io.StringIO())  # Not due again yet
+            self.assertEqual(run_retention.call_count, 1)
+            call_command('run_cron_jobs', force=True, stdout=io.StringIO())
+            self.assertEqual(run_retention.call_count, 2)
+        self.assertEqual(CronJobLog.objects.filter(code='flood_app.prune_history').count(), 2)
+
+    def test_rainfall_reports_are_pruned_only_when_opted_in(self):
+        upsert_weather_columns(LOCATIONS[0], hourly_columns(48))
+        profile = User.objects.create_user('reporter').userprofile
+        RainfallData.objects.create(user=profile, location=LOCATIONS[0], rainfall_amount=12.0,
+                                    collected_time=START, source='citizen')
+        now = START + datetime.timedelta(days=30)
+        with self.settings(RETENTION_RAW_DAYS=7, RETENTION_ROLLUP_DAYS=0, RETENTION_REPORT_DAYS=0):
+            self.assertEqual(prune_history(now=now, pause=0), {'weather': 48})
+        self.assertEqual(RainfallData.objects.count(), 1)
+        with self.settings(RETENTION_RAW_DAYS=7, RETENTION_ROLLUP_DAYS=0, RETENTION_REPORT_DAYS=7):
+            self.assertEqual(prune_history(now=now, pause=0), {'weather': 0, 'rainfall': 1})
+
+    def test_chunked_delete(self):
+        upsert_weather_columns(LOCATIONS[0], hourly_columns(100))
+        upsert_weather_columns(LOCATIONS[1], hourly_columns(30))
+        deleted = delete_in_chunks(WeatherData.objects.filter(location=LOCATIONS[0]), chunk_size=7, pause=0)
+        self.assertEqual(deleted, 100)
+        self.assertEqual(WeatherData.objects.count(), 30)
+
+
+class CollectWeatherTests(TestCase):
+    def command(self, fetch):
+        """collect_weather_data with Meteostat replaced by ``fetch`` and no retry delays."""
+        command = collect_weather_data.Command(stdout=io.StringIO())
+        command.fetch_meteostat_data = fetch
+        return command
+
+    def test_fetch_city_retries_with_backoff(self):
+        attempts = []
+
+        def flaky(location, point, start, end, timeout=30.0):
+            attempts.append(timeout)
+            if len(attempts) < 3:
+                raise ConnectionError('upstream timed out')
+            return hourly_columns(2)
+
+        command = self.command(flaky)
+        with mock.patch.object(collect_weather_data.time, 'sleep') as sleep:
+            columns = command.fetch_city(LOCATIONS[0], None, START, START, timeout=5.0, retries=3)
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(attempts, [5.0, 5.0, 5.0])
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [1.0, 2.0])
+
+    def test_fetch_city_gives_up_after_retries(self):
+        def down(location, point, start, end, timeout=30.0):
+            raise ConnectionError('upstream down')
+
+        command = self.command(down)
+        with mock.patch.object(collect_weather_data.time, 'sleep') as sleep:
+            columns = command.fetch_city(LOCATIONS[0], None, START, START, retries=2)
+        self.assertEqual(len(columns), 0)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertIn('failed for', command.stdout.getvalue())
+
+    def test_weatherapi_fetch_has_a_single_retry_layer(self):
+        self.assertEqual(get_session(retries=0).get_adapter('http://api.weatherapi.com').max_retries.total, 0)
+        self.assertIsNot(get_session(retries=0), get_session())
+
+        with mock.patch.object(collect_weather_data, 'get_session') as session:
+            session.return_value.get.side_effect = ConnectionError('upstream down')
+            command = collect_weather_data.Command(stdout=io.StringIO())
+            with mock.patch.object(collect_weather_data.time, 'sleep'):
+                command.fetch_city(LOCATIONS[0], None, START, START, use_weatherapi=True, retries=3)
+        session.assert_called_with(retries=0)
+        self.assertEqual(session.return_value.get.call_count, 3)
+
+    def test_writes_stay_on_the_main_thread(self):
+        fetch_threads, write_threads = set(), set()
+
+        def fetch(location, point, start, end, timeout=30.0):
+            fetch_threads.add(threading.current_thread())
+            return hourly_columns(3, start=start.replace(tzinfo=UTC, minute=0, second=0, microsecond=0))
+
+        def write(location, columns):
+            write_threads.add(threading.current_thread())
+            return upsert_weather_columns(location, columns)
+
+        command = self.command(fetch)
+        with mock.patch.object(collect_weather_data, 'upsert_weather_columns', side_effect=write), \
+                mock.patch.object(collect_weather_data, 'update_model', return_value=False):
+            command.handle(workers=4, retries=1)
+        self.assertEqual(write_threads, {threading.main_thread()})
+        self.assertNotIn(threading.main_thread(), fetch_threads)
+        self.assertEqual(WeatherData.objects.count(), 3 * Location.objects.count())
+
+
+class LiveWeatherTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_live_weather_is_cached_not_stored(self):
+        response = mock.Mock()
+        response.json.return_value = {'dt': 1780000000, 'main': {'temp': 21.5, 'humidity': 80}, 'rain': {'1h': 2.0}}
+        with mock.patch('flood_app.weather_cache.get_session') as get_session:
+            get_session.return_value.get.return_value = response
+            first = get_live_weather('Lalitpur, Nepal')
+            second = get_live_weather('lalitpur,  nepal')
+        self.assertEqual(first, second)
+        self.assertEqual(first['rainfall'], 2.0)
+        self.assertEqual(get_session.return_value.get.call_count, 1)
+        # Free-text profile locations never become WeatherData locations
+        self.assertFalse(WeatherData.objects.exists())
+
+
+    def test_failed_fetch_is_not_repeated_by_waiting_callers(self):
+        with mock.patch('flood_app.weather_cache.get_session') as get_session:
+            get_session.return_value.get.side_effect = ConnectionError('upstream down')
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(get_live_weather('Lalitpur')))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [None] * 4)
+        self.assertEqual(get_session.return_value.get.call_count, 1)
+
+
+class PipelineTests(TestCase):
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        self.feature_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.model_dir)
+        self.addCleanup(shutil.rmtree, self.feature_dir)
+        overrides = override_settings(FLOOD_MODEL_DIR=self.model_dir, FLOOD_FEATURE_CACHE_DIR=self.feature_dir)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for seed, location in enumerate(LOCATIONS):
+            upsert_weather_columns(location, hourly_columns(24 * 30, seed=seed))
+
+    def test_corrections_reach_cached_features(self):
+        refresh_features()
+        # Correct a week-old stretch, well before the last cached hour
+        columns = hourly_columns(6, seed=99, start=START + datetime.timedelta(days=7))
+        corrected = WeatherColumns(columns.recorded_at, columns.temperature, [40.0] * 6)
+        self.assertEqual(upsert_weather_columns(LOCATIONS[0], corrected), (0, 6))
+
+        incremental = refresh_features()[LOCATIONS[0]]
+        rebuilt = refresh_features(rebuild=True)[LOCATIONS[0]]
+        self.assertEqual(incremental['rain'].max(), 40.0)
+        pd.testing.assert_frame_equal(incremental, rebuilt, check_names=False)
+
+    def test_artifact_is_written_after_the_version_is_claimed(self):
+        depth = len(connection.savepoint_ids)
+        calls = []
+
+        def failing_save(model, metadata, version=None):
+            calls.append((version, len(connection.savepoint_ids)))
+            raise OSError('disk full')
+
+        with mock.patch('flood_app.predict.save_model', failing_save), self.assertRaises(OSError):
+            train_model()
+        # Outside the claiming transaction, and the claim is released on failure
+        self.assertEqual(calls, [(1, depth)])
+        self.assertFalse(ModelEvaluation.objects.exists())
+        self.assertEqual(train_model()['version'], 1)
+
+    def test_parquet_runs_have_their_own_cache(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        export_table('weather', root)
+        # The database moves on after the export and a DB run caches that
+        columns = hourly_columns(6, seed=99, start=START + datetime.timedelta(days=7))
+        upsert_weather_columns(LOCATIONS[0], WeatherColumns(columns.recorded_at, columns.temperature, [40.0] * 6))
+        self.assertEqual(refresh_features()[LOCATIONS[0]]['rain'].max(), 40.0)
+
+        exported = refresh_features(parquet_root=root)[LOCATIONS[0]]
+        self.assertLess(exported['rain'].max(), 40.0)
+        pd.testing.assert_frame_equal(
+            exported, refresh_features(rebuild=True, parquet_root=root)[LOCATIONS[0]], check_names=False,
+        )
+        self.assertTrue(train_model(parquet_root=root))
+        self.assertEqual(refresh_features()[LOCATIONS[0]]['rain'].max(), 40.0)
+
+    def test_train_and_forecast(self):
+        result = train_model()
+        self.assertTrue(result)
+        self.assertEqual(result['version'], 1)
+        self.assertTrue(ModelEvaluation.objects.filter(version=1).exists())
+
+        forecast = run_predictions()
+        self.assertEqual(forecast['predictions'], len(LOCATIONS) * FORECAST_DAYS)
+        # A second run replaces the forecast window instead of adding to it
+        run_predictions()
+        self.assertEqual(FloodPrediction.objects.count(), len(LOCATIONS) * FORECAST_DAYS)
+        self.assertEqual(
+            FloodPrediction.objects.filter(probability__gte=0, probability__lte=1).count(),
+            len(LOCATIONS) * FORECAST_DAYS,
+        )
+
+    def test_versions_are_allocated_from_the_database(self):
+        # Another process sharing the database already recorded versions 1-3
+        for version in (1, 2, 3):
+            ModelEvaluation.objects.create(
+                version=version, n_train=1, n_test=1, training_seconds=0, accuracy=1,
+                confusion_matrix=[], per_class={}, calibration=[],
+            )
+        self.assertEqual(train_model()['version'], 4)
+        self.assertEqual(load_model()['metadata']['version'], 4)
+        self.assertGreater(ModelEvaluation.objects.get(version=4).n_test, 0)
+
+    def test_stale_station_keeps_other_forecasts(self):
+        # Pokhara's feed runs five days ahead of Kathmandu's
+        upsert_weather_columns(LOCATIONS[1], hourly_columns(24 * 5, seed=5, start=START + datetime.timedelta(days=30)))
+        earlier = FloodPrediction.objects.create(
+            location=LOCATIONS[1], predicted_date=START + datetime.timedelta(days=32),
+            probability=0.1, severity_level=4,
+        )
+        train_model()
+        run_predictions()
+        self.assertTrue(FloodPrediction.objects.filter(pk=earlier.pk).exists())
+        self.assertEqual(FloodPrediction.objects.count(), len(LOCATIONS) * FORECAST_DAYS + 1)
+
+    @override_settings(FLOOD_MIN_GROUP_SAMPLES=100)
+    def test_grouped_models_share_one_version(self):
+        result = train_model(grouping='location', workers=1)
+        artifact = load_model()
+        self.assertEqual(artifact['metadata']['version'], result['version'])
+        model = artifact['model']
+        self.assertIsInstance(model, GroupedModel)
+        self.assertEqual(sorted(model.models), sorted(LOCATIONS))
+        # Locations without a model of their own use the global fallback
+        self.assertIs(model.model_for('Jumla (Karnali upstream)'), model.fallback)
+
+        forecast = run_predictions()
+        self.assertEqual(forecast['version'], result['version'])
+        self.assertEqual(FloodPrediction.objects.count(), len(LOCATIONS) * FORECAST_DAYS)
+
+    @override_settings(FLOOD_INCREMENTAL=True)
+    def test_incremental_updates_consume_only_new_rows(self):
+        self.assertEqual(train_model()['version'], 1)
+        labelled_before = len(labelled_rows(refresh_features())[1])
+
+        later = START + datetime.timedelta(days=30)
+        for seed, location in enumerate(LOCATIONS):
+            upsert_weather_columns(location, hourly_columns(24 * 3, seed=seed + 10, start=later))
+        labelled_after = len(labelled_rows(refresh_features())[1])
+
+        result = update_model()
+        self.assertEqual(result['version'], 2)
+        self.assertEqual(result['updated_rows'], labelled_after - labelled_before)
+        artifact = load_model()
+        self.assertEqual(artifact['metadata']['updates'], 1)
+        self.assertEqual(artifact['metadata']['n_samples'], labelled_after)
+        self.assertTrue(ModelEvaluation.objects.filter(version=2, n_train=result['updated_rows'], prequential=True).exists())
+
+        # Nothing new: no version is written
+        self.assertEqual(update_model()['updated_rows'], 0)
+        with override_settings(FLOOD_FULL_RETRAIN_DAYS=0):
+            self.assertNotIn('updated_rows', update_model())
+        self.assertEqual(load_model()['metadata']['version'], 3)
+        self.assertEqual(len(run_predictions()['timings']), 4)
+        # The dashboard's evaluation history only lists held-out evaluations
+        response = self.client.get(reverse('prediction_dashboard'))
+        self.assertEqual([e.version for e in response.context['evaluations']], [3, 1])
+
+    def test_alerts_are_delivered_once(self):
+        user = User.objects.create_user('resident')
+        user.userprofile.location = 'kathmandu'
+        user.userprofile.phone = '9800000000'
+        user.userprofile.save()
+        FloodPrediction.objects.create(
+            location=LOCATIONS[0], predicted_date=datetime.datetime(2100, 1, 1, tzinfo=UTC),
+            probability=0.95, severity_level=1,
+        )
+
+        provider = FakeProvider()
+        first = send_flood_alerts(AlertDispatcher(provider=provider, rate=1000, workers=2))
+        second = send_flood_alerts(AlertDispatcher(provider=provider, rate=1000, workers=2))
+        self.assertEqual(first, {'sent': 1, 'failed': 0, 'skipped': 0})
+        self.assertEqual(second, {'sent': 0, 'failed': 0, 'skipped': 1})
+        self.assertEqual(len(provider.sent), 1)
+        self.assertEqual(AlertDelivery.objects.get().status, 'sent')
+        self.assertEqual(FloodAlert.objects.get().station.name, LOCATIONS[0])
+
+
+    def test_ledger_keeps_up_with_the_sends(self):
+        for i in range(5):
+            user = User.objects.create_user(f'resident{i}')
+            user.userprofile.location = 'kathmandu'
+            user.userprofile.phone = f'980000000{i}'
+            user.userprofile.save()
+        FloodPrediction.objects.create(
+            location=LOCATIONS[0], predicted_date=datetime.datetime(2100, 1, 1, tzinfo=UTC),
+            probability=0.95, severity_level=1,
+        )
+
+        class CrashingDispatcher(AlertDispatcher):
+            def completed(self, messages):
+                for i, result in enumerate(super().completed(messages)):
+                    if i == 3:
+                        raise RuntimeError('worker killed')
+                    yield result
+
+        provider = FakeProvider()
+        with mock.patch.object(send_alerts, 'LEDGER_BATCH_SIZE', 1), self.assertRaises(RuntimeError):
+            send_flood_alerts(CrashingDispatcher(provider=provider, rate=1000, workers=1))
+        # Every result handed back before the crash is already in the ledger
+        self.assertEqual(AlertDelivery.objects.filter(status='sent').count(), 3)
+
+        rerun = send_flood_alerts(AlertDispatcher(provider=provider, rate=1000, workers=2))
+        self.assertEqual(rerun, {'sent': 2, 'failed': 0, 'skipped': 3})
+        self.assertEqual(AlertDelivery.objects.count(), 5)
+        # The rerun reached new recipients without adding a second alert
+        self.assertEqual(FloodAlert.objects.count(), 1)
+
+
+class AlertDispatcherTests(TestCase):
+    def test_concurrent_sends_stay_within_the_rate(self):
+        rate, burst, count = 50, 5, 30
+        messages = [
+            AlertMessage(LOCATIONS[0], START, 1, i, f'+977980000{i:04d}', f'message {i}')
+            for i in range(count)
+        ]
+        provider = FakeProvider()
+        started = time.monotonic()
+        results = AlertDispatcher(provider=provider, rate=rate, burst=burst, workers=8).dispatch(messages)
+        elapsed = time.monotonic() - started
+        # The burst goes out at once; every further message waits for a token
+        self.assertGreaterEqual(elapsed, (count - burst) / rate)
+        self.assertEqual([result.status for result in results], ['sent'] * count)
+        self.assertEqual(sorted(body for _, body in provider.sent), sorted(m.body for m in messages))
+
+
+class JobTests(TestCase):
+    def test_views_import_without_sklearn(self):
+        # A fresh interpreter, since this test process has already loaded it
+        code = ("import sys, django; django.setup(); import flood_app.urls; "
+                "sys.exit('sklearn' in sys.modules)")
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_one_active_job_per_kind(self):
+        PipelineJob.objects.create(kind='predict')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PipelineJob.objects.create(kind='predict')
+        PipelineJob.objects.filter(kind='predict').update(status='succeeded')
+        PipelineJob.objects.create(kind='predict')
+
+    def test_second_request_returns_the_active_job(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            first = self.client.post(reverse('predict_and_alert'))
+            second = self.client.post(reverse('predict_and_alert'))
+        self.assertEqual((first.status_code, second.status_code), (202, 202))
+        self.assertFalse(first.json()['deduplicated'])
+        self.assertTrue(second.json()['deduplicated'])
+        self.assertEqual(first.json()['job_id'], second.json()['job_id'])
+        self.assertEqual(len(callbacks), 1)  # Only one worker is started
+        self.assertEqual(PipelineJob.objects.count(), 1)
+
+        status = self.client.get(first.json()['status_url'])
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.json()['status'], 'queued')
+
+    def test_only_jobs_without_a_heartbeat_expire(self):
+        long_ago = timezone.now() - datetime.timedelta(minutes=settings.PIPELINE_JOB_STALE_MINUTES * 3)
+        job = PipelineJob.objects.create(kind='predict', status='running')
+        # Running for hours, but the worker is still alive
+        PipelineJob.objects.filter(pk=job.pk).update(created_at=long_ago, started_at=long_ago)
+        _expire_stale_jobs('predict')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+
+        PipelineJob.objects.filter(pk=job.pk).update(heartbeat_at=long_ago)
+        _expire_stale_jobs('predict')
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_steps_record_progress_and_results(self):
+        job = PipelineJob.objects.create(kind='predict')
+        steps = [('predictions', 'Forecasting', lambda: {'predictions': 14}), ('alerts', 'Alerting', lambda: {})]
+        with mock.patch.dict(JOB_STEPS, {'predict': steps}):
+            _run_steps(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), ('succeeded', 'Done'))
+        self.assertGreaterEqual(job.heartbeat_at, job.started_at)
+        self.assertEqual(job.result, {'predictions': {'predictions': 14}, 'alerts': {}})
+
+        # A new job can start once the previous one has finished
+        self.assertEqual(self.client.post(reverse('predict_and_alert')).status_code, 202)
+        self.assertEqual(PipelineJob.objects.count(), 2)
+
+
+class LocationTests(TestCase):
+    def setUp(self):
+        self.index = LocationIndex([
+            (1, 'Kathmandu (Bagmati River)', 'Kathmandu', ['KTM']),
+            (2, 'Birgunj (Bagmati River)', 'Birgunj', ['Birganj']),
+            (3, 'Dang (Rapti River)', 'Dang', ['Ghorahi']),
+            (4, 'Dhangadhi (Mahakali River)', 'Dhangadhi', []),
+        ])
+
+    def test_resolve(self):
+        self.assertEqual(self.index.resolve('Kathmandu (Bagmati River)'), 1)
+        self.assertEqual(self.index.resolve(' kathmandu '), 1)
+        self.assertEqual(self.index.resolve('ktm'), 1)
+        self.assertEqual(self.index.resolve('Birganj'), 2)
+        self.assertEqual(self.index.resolve('dan'), 3)
+        self.assertIsNone(self.index.resolve('d'))  # Ambiguous
+        self.assertIsNone(self.index.resolve('Lalitpur'))
+
+    def test_search_matches_word_prefixes(self):
+        self.assertEqual(sorted(self.index.search('bagm')), [1, 2])
+        self.assertEqual(self.index.search('ghor'), [3])
+        self.assertEqual(self.index.search('rapti river'), [3])
+        self.assertEqual(self.index.search(''), [])
+
+    def test_citizen_without_station_sees_no_alerts(self):
+        station = Location.objects.get(name=LOCATIONS[0])
+        FloodAlert.objects.create(location='Lalitpur', message='Unassigned alert')
+        FloodAlert.objects.create(location=station.name, station=station, message='Kathmandu alert')
+        user = User.objects.create_user('citizen', password='secret')
+        self.client.force_login(user)
+        self.assertIsNone(user.userprofile.station_id)
+
+        response = self.client.get(reverse('alert_management'))
+        self.assertEqual(list(response.context['alerts']), [])
+
+        UserProfile.objects.filter(user=user).update(station=station)
+        response = self.client.get(reverse('alert_management'))
+        self.assertEqual([alert.message for alert in response.context['alerts']], ['Kathmandu alert'])
+
+    def test_rows_get_station_keys(self):
+        self.assertEqual(Location.objects.count(), 20)
+        upsert_weather_columns(LOCATIONS[1], hourly_columns(3))
+        station = Location.objects.get(name=LOCATIONS[1])
+        self.assertEqual(WeatherData.objects.filter(station=station).count(), 3)
+        self.assertEqual(resolve_location('Pokhara'), station.pk)
+
+        user = User.objects.create_user('citizen')
+        user.userprofile.location = 'Pokhara'
+        user.userprofile.save()
+        self.assertEqual(user.userprofile.station, station)
+
+
+class StationTests(TestCase):
+    def test_nearest_matches_haversine(self):
+        rows = list(Location.objects.values_list('id', 'latitude', 'longitude'))
+        rng = np.random.default_rng(0)
+        lats, lons = rng.uniform(26.3, 30.4, 500), rng.uniform(80.0, 88.2, 500)
+        ids = np.array([row[0] for row in rows])
+        lat1, lon1 = np.radians(lats)[:, None], np.radians(lons)[:, None]
+        lat2, lon2 = np.radians([row[1] for row in rows]), np.radians([row[2] for row in rows])
+        distance = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        np.testing.assert_array_equal(StationTree(rows).nearest(lats, lons), ids[distance.argmin(axis=1)])
+
+    def test_profiles_get_nearest_station(self):
+        self.assertIsNotNone(geocode('Lalitpur, Nepal'))
+        self.assertIsNone(geocode('Atlantis'))
+        user = User.objects.create_user('citizen')
+        user.userprofile.location = 'Lalitpur'
+        user.userprofile.save()
+        self.assertEqual(user.userprofile.station.display_name, 'Kathmandu')
+
+        # Explicit coordinates win over the location text
+        user.userprofile.latitude, user.userprofile.longitude = 28.2, 83.98
+        user.userprofile.save()
+        self.assertEqual(user.userprofile.station.display_name, 'Pokhara')
+
+    def test_unchanged_profile_saves_without_a_lookup(self):
+        user = User.objects.create_user('citizen')
+        UserProfile.objects.filter(user=user).update(location='Lalitpur')
+        profile = UserProfile.objects.get(user=user)
+        profile.save()  # Assigns the station
+        profile = UserProfile.objects.get(user=user)
+        profile.role = 'Analyst'
+        with self.assertNumQueries(1):  # The UPDATE only
+            profile.save()
+        with self.assertNumQueries(1):
+            profile.save(update_fields=['role'])
+        profile.location = 'Pokhara'
+        profile.save()
+        self.assertEqual(UserProfile.objects.get(user=user).station.display_name, 'Pokhara')
+
+    def test_no_stations(self):
+        Location.objects.all().delete()
+        # The cached indexes outlive the test's rollback of the delete
+        self.addCleanup(invalidate_location_index, Location)
+        self.assertIsNone(nearest_station(27.7, 85.3))
+        user = User.objects.create_user('citizen')
+        user.userprofile.latitude, user.userprofile.longitude = 27.7, 85.3
+        user.userprofile.save()
+        self.assertIsNone(UserProfile.objects.get(user=user).station_id)
+        self.assertEqual(assign_stations(reassign=True), (1, 0))
+
+    def test_bulk_assignment(self):
+        for i, location in enumerate(['Dharan', 'Dharan', 'Kohalpur', 'Atlantis']):
+            user = User.objects.create_user(f'citizen{i}')
+            UserProfile.objects.filter(user=user).update(location=location, latitude=None, longitude=None, station=None)
+        self.assertEqual(assign_stations(chunk_size=3), (3, 1))
+        stations = dict(
+            User.objects.filter(username__startswith='citizen')
+            .values_list('userprofile__location', 'userprofile__station__display_name')
+        )
+        self.assertEqual(stations, {'Dharan': 'Biratnagar', 'Kohalpur': 'Nepalgunj', 'Atlantis': None})
+
+
+class BasinTests(TestCase):
+    def setUp(self):
+        # 1 -> 2 (3h) -> 4 (5h) <- 3 (2h)
+        self.graph = BasinGraph([
+            (1, 'Jumla', 'Karnali', 2, 3), (2, 'Surkhet', 'Karnali', 4, 5),
+            (3, 'Dailekh', 'Karnali', 4, 2), (4, 'Gulariya', 'Karnali', None, 0), (5, 'Dhangadhi', 'Mahakali', None, 0),
+        ])
+
+    def test_topological_order(self):
+        position = {name: i for i, name in enumerate(self.graph.order)}
+        self.assertLess(position['Jumla'], position['Surkhet'])
+        self.assertLess(position['Surkhet'], position['Gulariya'])
+        self.assertEqual(self.graph.downstream_path('Jumla'), [('Surkhet', 3), ('Gulariya', 8)])
+        with self.assertRaises(ValueError):
+            BasinGraph([(1, 'A', 'X', 2, 1), (2, 'B', 'X', 1, 1)])
+
+    def test_seeded_graph(self):
+        graph = BasinGraph(list(Location.objects.values_list('id', 'name', 'basin', 'downstream_id', 'travel_hours')))
+        self.assertEqual(len(graph.order), Location.objects.count())
+        self.assertIn(('Jumla (Karnali upstream)', 36), graph.upstream['Gulariya (Karnali River)'])
+
+    def test_upstream_rain_is_lagged_and_accumulated(self):
+        index = pd.date_range(START, periods=48, freq='h')
+        rng = np.random.default_rng(0)
+        frames = {
+            name: pd.DataFrame({'rain_24h': rng.random(48), 'rain_72h': rng.random(48)}, index=index)
+            for name in ['Jumla', 'Surkhet', 'Dailekh', 'Gulariya']
+        }
+        add_upstream_features(frames, self.graph)
+        jumla, surkhet, dailekh = (frames[name]['rain_24h'].to_numpy() for name in ['Jumla', 'Surkhet', 'Dailekh'])
+        expected = np.zeros(48)
+        expected[5:] += surkhet[:-5]
+        expected[8:] += jumla[:-8]
+        expected[2:] += dailekh[:-2]
+        np.testing.assert_allclose(frames['Gulariya']['upstream_rain_24h'], expected)
+        self.assertEqual(frames['Jumla']['upstream_rain_72h'].sum(), 0)
+
+    def test_basin_risk(self):
+        summaries = basin_risk({'Jumla': (0.9, 1), 'Gulariya': (0.3, 3), 'Dhangadhi': (0.2, 4)}, (1, 2), self.graph)
+        self.assertEqual([summary['basin'] for summary in summaries], ['Karnali', 'Mahakali'])
+        self.assertEqual(summaries[0]['at_risk'], ['Jumla'])
+        self.assertEqual(summaries[0]['downstream'], [('Surkhet', 3), ('Gulariya', 8)])
+
+
+class PredictionCsvTests(TestCase):
+    def setUp(self):
+        station = Location.objects.get(name=LOCATIONS[0])
+        FloodPrediction.objects.bulk_create(
+            FloodPrediction(location=station.name, station=station, probability=day,
+                            predicted_date=START + datetime.timedelta(days=day, hours=23), severity_level=4)
+            for day in range(5)
+        )
+
+    def download(self, **params):
+        response = self.client.get(reverse('download_predictions_csv'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        return response, chunks
+
+    def test_date_filters_cover_whole_days(self):
+        response, chunks = self.download(start='2026-06-02', end='2026-06-04')
+        self.assertEqual(chunks[0], b'Location,Predicted Date,Probability,Severity Level\r\n')
+        lines = b''.join(chunks).decode().splitlines()[1:]
+        # The last hour of the end date is included, the next day is not
+        self.assertEqual([line.split(',')[1] for line in lines],
+                         ['2026-06-02 23:00:00', '2026-06-03 23:00:00', '2026-06-04 23:00:00'])
+
+    def test_gzip_stream(self):
+        response, chunks = self.download(gzip='1', end='2026-06-01')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        # The compressed header is flushed before any rows are read
+        self.assertTrue(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(chunks[0]).startswith(b'Location,'))
+        lines = gzip.decompress(b''.join(chunks)).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(LOCATIONS[0]))
+
+    def test_invalid_date(self):
+        response = self.client.get(reverse('download_predictions_csv'), {'start': '2026-13-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DatabaseTests(TestCase):
+    def test_userprofile_table_view_uses_orm(self):
+        user = User.objects.create_user('viewer', password='secret')
+        self.client.force_login(user)
+        response = self.client.get(reverse('show_userprofile_table'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('location', response.context['columns'])
+        self.assertEqual(len(list(response.context['rows'])), 1)
+
+    def test_sqlite_pragmas_applied(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        pragmas = settings.SQLITE_PRAGMAS
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], pragmas['cache_size'])
+            cursor.execute('PRAGMA synchronous')
+            levels = {'OFF': 0, 'NORMAL': 1, 'FULL': 2, 'EXTRA': 3}
+            self.assertEqual(cursor.fetchone()[0], levels[str(pragmas['synchronous']).upper()])
+
+        # The test database lives in memory, which can't use WAL; open a file database too
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        file_db = type(connections['default'])({**connection.settings_dict, 'NAME': f'{directory}/pragmas.sqlite3'})
+        try:
+            with file_db.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], str(pragmas['journal_mode']).lower())
+        finally:
+            file_db.close()
@@ -0,0 +1,122 @@
+"""Model fitting that runs in worker processes.
+
+Nothing here imports Django, so a spawned worker can import this module
+without configuring settings or opening database connections.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+
+def make_model(classes=None):
+    """Logistic Regression on scaled features; incremental if ``classes`` is given."""
+    if classes is not None:
+        return IncrementalModel(classes)
+    # Logistic Regression (multinomial for multi-class data) on scaled features
+    return make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000))
+
+
+def fit_model(X, y, classes=None):
+    return make_model(classes).fit(X, y)
+
+
+def fit_models(datasets, workers=None, classes=None):
+    """Fit one model per ``{key: (X, y)}`` entry, across ``workers`` processes.
+
+    ``classes`` fits IncrementalModels over those labels instead.
+
+    Workers are spawned rather than forked: training also runs from a
+    background thread of the web process (see flood_app.jobs), and forking a
+    threaded process can deadlock the child.
+    """
+    workers = min(workers or os.cpu_count() or 1, len(datasets))
+    if workers <= 1:
+        return {key: fit_model(X, y, classes) for key, (X, y) in datasets.items()}
+    # Largest datasets first, so a big fit doesn't start last and run alone
+    keys = sorted(datasets, key=lambda key: len(datasets[key][1]), reverse=True)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {key: pool.submit(fit_model, *datasets[key], classes) for key in keys}
+        return {key: future.result() for key, future in futures.items()}
+
+
+class IncrementalModel:
+    """Scaled features into an SGD logistic regression that keeps learning.
+
+    Both steps support partial_fit, so newly labelled rows update the model
+    without revisiting the rows it has already seen. ``classes`` fixes the
+    label set up front, since a batch rarely contains every severity.
+    """
+
+    def __init__(self, classes, epochs=5, random_state=42):
+        self.classes = np.asarray(classes)
+        self.epochs = epochs
+        self.random_state = random_state
+        self.scaler = StandardScaler()
+        self.classifier = SGDClassifier(loss='log_loss', random_state=random_state)
+
+    @property
+    def classes_(self):
+        return self.classifier.classes_
+
+    def fit(self, X, y):
+        """Fit from scratch with a few shuffled passes over ``X``."""
+        X = self.scaler.fit(X).transform(X)
+        rng = np.random.default_rng(self.random_state)
+        for _ in range(self.epochs):
+            order = rng.permutation(len(y))
+            self.classifier.partial_fit(X[order], y[order], classes=self.classes)
+        return self
+
+    def partial_fit(self, X, y):
+        self.scaler.partial_fit(X)
+        self.classifier.partial_fit(self.scaler.transform(X), y, classes=self.classes)
+        return self
+
+    def predict_proba(self, X):
+        return self.classifier.predict_proba(self.scaler.transform(X))
+
+
+class GroupedModel:
+    """One classifier per location or basin, with a global fallback.
+
+    ``groups`` maps each location to its group; locations whose group has no
+    model of its own are scored by ``fallback``.
+    """
+
+    def __init__(self, grouping, fallback, models, groups):
+        self.grouping = grouping
+        self.fallback = fallback
+        self.models = models
+        self.groups = groups
+        self.classes_ = np.unique(np.concatenate(
+            [fallback.classes_, *(model.classes_ for model in models.values())]
+        ))
+
+    def model_for(self, location):
+        return self.models.get(self.groups.get(location), self.fallback)
+
+    def partial_fit(self, X, y, locations):
+        """Update the fallback with every row and each group model with its own rows."""
+        self.fallback.partial_fit(X, y)
+        groups = np.array([self.groups.get(location) for location in locations], dtype=object)
+        for group, model in self.models.items():
+            rows = groups == group
+            if rows.any():
+                model.partial_fit(X[rows], y[rows])
+        return self
+
+    def predict_proba(self, X, locations):
+        """Class probabilities over ``classes_``, each row scored by its location's model."""
+        locations = np.asarray(locations)
+        proba = np.zeros((len(X), len(self.classes_)))
+        for location in np.unique(locations):
+            rows = locations == location
+            model = self.model_for(location)
+            columns = np.searchsorted(self.classes_, model.classes_)
+            proba[np.ix_(rows, columns)] = model.predict_proba(X[rows])
+        return proba
@@ -1,30 +1,28 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.utils.dateparse import parse_date
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, StreamingHttpResponse
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.core.paginator import Paginator
 from django.contrib import messages
-from django.conf import settings
 from django.db import transaction, IntegrityError
+from django.db.models import Count, Max, Min
 from django.contrib.auth.models import User
-from collections import Counter
-from sklearn.metrics import confusion_matrix
-from datetime import datetime
-import requests
+from django.utils import timezone
 import csv
-import sqlite3
+import datetime
+import zlib
 
-from .models import WeatherData, FloodPrediction, UserProfile, FloodAlert
-from .predict import train_predict_model
-from .send_alerts import send_flood_alerts
+from .models import WeatherData, FloodPrediction, UserProfile, FloodAlert, ModelEvaluation, Location, PipelineJob
+from .weather_cache import get_live_weather
+from .rollups import weather_series
+from .locations import search_locations
+from .basins import basin_risk
+from .constants import FLOOD_LEVELS, SEVERITY_MAP
 
-# --- Severity Mapping ---
-SEVERITY_MAP = {
-    1: "Critical",
-    2: "High",
-    3: "Moderate",
-    4: "Low"
-}
+RAINFALL_TREND_DAYS = 90
+LOCATION_SEARCH_LIMIT = 50  # Stations a search box query can expand to
 
 # --- Registration ---
 def register_user(request):
@@ -127,36 +125,30 @@ def homepage(request):
 def user_dashboard(request):
     try:
         profile = request.user.userprofile
-        location = profile.location.replace(" ", "+")
-        api_key = settings.WEATHERAPI_KEY
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={api_key}&units=metric"
-        response = requests.get(url)
+        live_weather = get_live_weather(profile.location) if profile.location else None
 
         dashboard_data = {'role': profile.role}
+        station = profile.station
 
-        if response.status_code == 200:
-            data = response.json()
-            recorded_at = datetime.fromtimestamp(data['dt'])
-            live_weather = {
-                'recorded_at': recorded_at,
-                'temperature': data['main']['temp'],
-                'rainfall': data.get('rain', {}).get('1h', 0),
-                'humidity': data['main']['humidity'],
-                'location': profile.location,
-            }
-            WeatherData.objects.update_or_create(
-                location=profile.location,
-                recorded_at=recorded_at,
-                defaults=live_weather
-            )
+        if live_weather:
             dashboard_data['weather_data'] = [live_weather]
         else:
             messages.warning(request, "Unable to fetch live weather.")
             dashboard_data['weather_data'] = WeatherData.objects.filter(
-                location__icontains=profile.location).order_by('-recorded_at')[:5]
+                station=station).order_by('-recorded_at')[:5] if station else []
 
         dashboard_data['alerts'] = FloodAlert.objects.filter(
-            location__icontains=profile.location).order_by('-created_at')[:5]
+            station=station).order_by('-created_at')[:5] if station else []
+
+        # Daily rainfall trend, read from the rollups rather than hourly rows
+        if station:
+            end = timezone.now()
+            series = weather_series(station.name, end - datetime.timedelta(days=RAINFALL_TREND_DAYS), end, 'day')
+            dashboard_data['rainfall_trend'] = {
+                'labels': [row['period_start'].strftime('%Y-%m-%d') for row in series],
+                'rain_sum': [round(row['rain_sum'], 1) for row in series],
+                'temp_mean': [round(row['temp_mean'], 1) for row in series],
+            }
 
         return render(request, 'dashboard.html', dashboard_data)
 
@@ -166,37 +158,97 @@ def user_dashboard(request):
 
 
 # --- Predict & Alert ---
+def _job_payload(job):
+    return {
+        "job_id": job.pk,
+        "status": job.status,
+        "progress": job.progress,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
 def predict_and_alert(request):
+    # Imported here so serving the other views never loads scikit-learn
+    from .jobs import enqueue_job
+
     try:
-        if not train_predict_model():
-            return JsonResponse({"status": "No data for prediction"}, status=400)
-        send_flood_alerts()
-        return JsonResponse({"status": "Prediction and alerts sent"}, status=200)
+        job, created = enqueue_job('predict')
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+    payload = _job_payload(job)
+    payload["status_url"] = reverse('prediction_job_status', args=[job.pk])
+    payload["deduplicated"] = not created
+    return JsonResponse(payload, status=202)
+
+
+def prediction_job_status(request, job_id):
+    job = get_object_or_404(PipelineJob, pk=job_id)
+    return JsonResponse(_job_payload(job))
+
+
+# --- Location Search ---
+def location_search(request):
+    """Stations whose name, alias or any word starts with ``q``, for search box suggestions."""
+    ids = search_locations(request.GET.get('q', ''))
+    stations = Location.objects.in_bulk(ids)
+    return JsonResponse({'results': [
+        {'id': pk, 'name': stations[pk].name, 'display_name': stations[pk].display_name, 'basin': stations[pk].basin}
+        for pk in ids if pk in stations
+    ]})
 
 
 # --- Prediction Dashboard ---
 def prediction_dashboard(request):
     query = request.GET.get('q', '')
-    predictions = FloodPrediction.objects.filter(location__icontains=query) if query else FloodPrediction.objects.all()
-
-    if predictions.exists():
-        severity_vals = [p.severity_level for p in predictions]
-        counter = Counter(severity_vals)
-        labels = sorted(counter.keys())
-        chart_labels = [SEVERITY_MAP.get(k, str(k)) for k in labels]
-        chart_counts = [counter[k] for k in labels]
-        matrix = confusion_matrix(severity_vals, severity_vals, labels=[1, 2, 3, 4]).tolist()
-    else:
-        chart_labels, chart_counts, matrix = [], [], []
+    predictions = FloodPrediction.objects.all()
+    if query:
+        predictions = predictions.filter(station_id__in=search_locations(query, limit=LOCATION_SEARCH_LIMIT))
+
+    # Severity counts come from a single GROUP BY instead of loading every row
+    counter = dict(
+        predictions.order_by().values('severity_level')
+        .annotate(count=Count('id')).values_list('severity_level', 'count')
+    )
+    labels = sorted(counter.keys())
+    chart_labels = [SEVERITY_MAP.get(k, str(k)) for k in labels]
+    chart_counts = [counter[k] for k in labels]
+    total_predictions = sum(chart_counts)
+
+    # Stored held-out evaluations of the most recent full retrains (one query);
+    # prequential scores of incremental updates aren't comparable with them
+    evaluations = list(ModelEvaluation.objects.filter(prequential=False).order_by('-version')[:10])
+    evaluation = evaluations[0] if evaluations else None
+    matrix = evaluation.confusion_matrix if evaluation else []
+    per_class = [
+        (SEVERITY_MAP[int(level)], scores) for level, scores in sorted(evaluation.per_class.items())
+    ] if evaluation else []
+
+    # Peak forecast per station (one GROUP BY), folded into river basins
+    station_risk = {
+        name: (probability, severity)
+        for name, probability, severity in predictions.filter(station__isnull=False).order_by()
+        .values('station__name').annotate(peak=Max('probability'), worst=Min('severity_level'))
+        .values_list('station__name', 'peak', 'worst')
+    }
+    basins = basin_risk(station_risk, FLOOD_LEVELS)
+
+    page_obj = Paginator(predictions.order_by('predicted_date', 'id'), 50).get_page(request.GET.get('page'))
 
     return render(request, 'prediction_dashboard.html', {
-        'predictions': predictions,
+        'predictions': page_obj,
+        'total_predictions': total_predictions,
         'query': query,
         'chart_labels': chart_labels,
         'chart_counts': chart_counts,
         'confusion_matrix': matrix,
+        'evaluation': evaluation,
+        'evaluations': evaluations,
+        'per_class': per_class,
+        'basins': basins,
         'SEVERITY_MAP': SEVERITY_MAP,
     })
 
@@ -304,53 +356,116 @@ def alert_management(request):
         messages.error(request, "User profile not found.")
         return redirect('homepage')
 
-    alerts = FloodAlert.objects.filter(location__icontains=profile.location) if profile.role == 'Citizen' else FloodAlert.objects.all()
+    if profile.role != 'Citizen':
+        alerts = FloodAlert.objects.all()
+    elif profile.station_id is None:
+        # Without a station, filtering on it would match every unassigned alert
+        messages.warning(request, "Set your location to see the alerts for your area.")
+        alerts = FloodAlert.objects.none()
+    else:
+        alerts = FloodAlert.objects.filter(station_id=profile.station_id)
     query = request.GET.get('q', '').strip()
     if query:
-        alerts = alerts.filter(location__icontains=query)
+        alerts = alerts.filter(station_id__in=search_locations(query, limit=LOCATION_SEARCH_LIMIT))
 
     page_obj = Paginator(alerts.order_by('-created_at'), 10).get_page(request.GET.get('page'))
     return render(request, 'alert_management.html', {'alerts': page_obj, 'query': query})
 
 
 # --- Download CSV ---
-def download_predictions_csv(request):
-    predictions = FloodPrediction.objects.all().order_by('predicted_date')
-    response = StreamingHttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="flood_predictions.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(['Location', 'Predicted Date', 'Probability', 'Severity Level'])
-    for p in predictions:
-        writer.writerow([
-            p.location,
-            p.predicted_date.strftime('%Y-%m-%d %H:%M:%S'),
-            f"{p.probability:.2f}%",
-            SEVERITY_MAP.get(p.severity_level, 'Unknown')
+CSV_CHUNK_SIZE = 2000  # Rows fetched per database round-trip
+CSV_BUFFER_BYTES = 64 * 1024  # Rows are sent in blocks of roughly this size
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def _prediction_csv_rows(predictions):
+    writer = csv.writer(Echo())
+    # The header goes out straight away, so the download starts before the first query
+    yield writer.writerow(['Location', 'Predicted Date', 'Probability', 'Severity Level']).encode()
+    buffer, size = [], 0
+    rows = predictions.values_list('location', 'predicted_date', 'probability', 'severity_level')
+    for location, predicted_date, probability, severity_level in rows.iterator(chunk_size=CSV_CHUNK_SIZE):
+        line = writer.writerow([
+            location,
+            predicted_date.strftime('%Y-%m-%d %H:%M:%S'),
+            f"{probability:.2f}%",
+            SEVERITY_MAP.get(severity_level, 'Unknown')
         ])
+        buffer.append(line)
+        size += len(line)
+        if size >= CSV_BUFFER_BYTES:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
 
-    return response
 
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)  # gzip container
+    for chunk in chunks:
+        # Sync-flush each block so the client receives it now rather than
+        # whenever zlib's internal buffer fills
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
 
 
-def show_userprofile_table(request):
-    db_path = settings.DATABASES['default']['NAME']
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def download_predictions_csv(request):
+    """Stream predictions as CSV in constant memory.
+
+    Optional filters: ``location`` (name, alias or prefix), ``start``/``end`` (YYYY-MM-DD,
+    inclusive) and ``severity`` (1-4 or a SEVERITY_MAP name). ``gzip=1``
+    compresses the stream with gzip content-encoding.
+    """
+    predictions = FloodPrediction.objects.order_by('predicted_date', 'id')
+
+    location = request.GET.get('location', '').strip()
+    if location:
+        predictions = predictions.filter(station_id__in=search_locations(location, limit=LOCATION_SEARCH_LIMIT))
+
+    # Plain datetime bounds rather than a __date lookup, so the
+    # predicted_date index can serve the range
+    for param, lookup, days in (('start', 'predicted_date__gte', 0), ('end', 'predicted_date__lt', 1)):
+        value = request.GET.get(param, '').strip()
+        if value:
+            try:
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                return HttpResponseBadRequest(f"Invalid {param} date; use YYYY-MM-DD.")
+            bound = datetime.datetime.combine(day + datetime.timedelta(days=days), datetime.time.min)
+            predictions = predictions.filter(**{lookup: timezone.make_aware(bound)})
+
+    severity = request.GET.get('severity', '').strip()
+    if severity:
+        names = {name.lower(): level for level, name in SEVERITY_MAP.items()}
+        level = int(severity) if severity.isdigit() else names.get(severity.lower())
+        if level not in SEVERITY_MAP:
+            return HttpResponseBadRequest("Invalid severity.")
+        predictions = predictions.filter(severity_level=level)
+
+    chunks = _prediction_csv_rows(predictions)
+    if request.GET.get('gzip') == '1':
+        response = StreamingHttpResponse(_gzip_stream(chunks), content_type='text/csv')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="flood_predictions.csv"'
+    return response
 
-    table_name = 'flood_app_userprofile'
-    # Get columns
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [col[1] for col in cursor.fetchall()]
 
-    # Get all rows
-    cursor.execute(f"SELECT * FROM {table_name}")
-    rows = cursor.fetchall()
 
-    conn.close()
+def show_userprofile_table(request):
+    fields = UserProfile._meta.concrete_fields
+    rows = UserProfile.objects.order_by('pk').values_list(*[field.attname for field in fields])
 
     return render(request, 'full_db_view.html', {
-        'columns': columns,
+        'columns': [field.column for field in fields],
         'rows': rows,
-        'table_name': table_name
+        'table_name': UserProfile._meta.db_table,
     })
@@ -0,0 +1,109 @@
+import datetime
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .outbound import get_session
+
+logger = logging.getLogger(__name__)
+
+OPENWEATHER_URL = 'http://api.openweathermap.org/data/2.5/weather'
+
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+
+
+def normalize_location(location):
+    return ' '.join(location.lower().split())
+
+
+def cache_key(location):
+    return 'live-weather:' + normalize_location(location).replace(' ', '+')
+
+
+def _key_lock(key):
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def fetch_live_weather(location):
+    """Fetch current conditions from OpenWeatherMap.
+
+    Nothing is written to WeatherData: ``location`` is a profile's free text,
+    not a station, and station history comes from collect_weather_data.
+    """
+    response = get_session().get(
+        OPENWEATHER_URL,
+        params={'q': location, 'appid': settings.WEATHERAPI_KEY, 'units': 'metric'},
+        timeout=settings.LIVE_WEATHER_TIMEOUT,
+    )
+    response.raise_for_status()
+    data = response.json()
+    live_weather = {
+        'recorded_at': datetime.datetime.fromtimestamp(data['dt'], tz=datetime.timezone.utc),
+        'temperature': data['main']['temp'],
+        'rainfall': data.get('rain', {}).get('1h', 0),
+        'humidity': data['main']['humidity'],
+        'location': location,
+    }
+    return live_weather
+
+
+def _refresh(location, key):
+    """Fetch and cache ``location``.
+
+    Concurrent callers in this process share a single fetch; the lock is
+    process-local, so each worker process makes its own. A failure is
+    remembered in the shared cache for LIVE_WEATHER_FAILURE_TTL, so callers
+    queued behind it, and other workers, don't each wait out the timeout.
+    """
+    with _key_lock(key):
+        entry = cache.get(key)
+        if entry and time.time() - entry['fetched_at'] < settings.LIVE_WEATHER_TTL:
+            return entry['data']
+        if cache.get(key + ':failed'):
+            return entry['data'] if entry else None
+        try:
+            data = fetch_live_weather(location)
+        except Exception as e:
+            logger.warning("Live weather fetch failed for %s: %s", location, e)
+            cache.set(key + ':failed', True, settings.LIVE_WEATHER_FAILURE_TTL)
+            return entry['data'] if entry else None
+        cache.set(
+            key,
+            {'data': data, 'fetched_at': time.time()},
+            settings.LIVE_WEATHER_TTL + settings.LIVE_WEATHER_STALE_TTL,
+        )
+        return data
+
+
+def _revalidate(location, key):
+    try:
+        _refresh(location, key)
+    finally:
+        connection.close()
+        cache.delete(key + ':refreshing')
+
+
+def get_live_weather(location):
+    """Return current weather for ``location`` from the shared cache.
+
+    Fresh entries (younger than LIVE_WEATHER_TTL) are returned as is. Stale
+    entries are returned immediately while one background refresh runs; the
+    ``:refreshing`` marker keeps other workers sharing the cache from starting
+    their own. Only a complete miss waits for the upstream API, and not at
+    all while a recent fetch for it failed. Returns None when no data is
+    available.
+    """
+    key = cache_key(location)
+    entry = cache.get(key)
+    if entry is None:
+        return _refresh(location, key)
+    if time.time() - entry['fetched_at'] >= settings.LIVE_WEATHER_TTL:
+        if cache.add(key + ':refreshing', True, settings.LIVE_WEATHER_TIMEOUT * 2):
+            threading.Thread(target=_revalidate, args=(location, key), daemon=True).start()
+    return entry['data']